@@ -1,42 +1,206 @@
+import argparse
+import json
+
 from loguru import logger
 import numpy as np
 
 from src.constants import *
-import src.graph_generator as generator
-from src.simulation import Simulation
-from src.visualizer import window
+# Neither module imports pygame or matplotlib, see generate_graphs().
+from src.interactions import INTERACTIONS, LONG_RANGE_INTERACTIONS
+from src.simulation import CLUSTER_UPDATE_SCHEMES, SUBLATTICE_UPDATE_SCHEMES, UPDATE_SCHEMES
 
-def verify_constants():
+def verify_constants(coupling_constant=NEAREST_NEIGHBOUR_COUPLING_CONSTANT, boltzmann_constant=BOLTZMANN_CONSTANT):
     # Warn user for untypical coupling constant for nearest neighbour interaction.
-    if NEAREST_NEIGHBOUR_COUPLING_CONSTANT < 0:
+    if coupling_constant < 0:
         logger.warning("Coupling constant (J) is negative, this might make the simulation exhibit undesired behaviour.")
-    if NEAREST_NEIGHBOUR_COUPLING_CONSTANT == 0:
+    if coupling_constant == 0:
         logger.warning("Coupling constant (J) is zero, this disables nearest neighbour spin interaction.")
     
     # Warn user for invalid value for the Boltzmann constant.
-    if BOLTZMANN_CONSTANT <= 0:
+    if boltzmann_constant <= 0:
         logger.critical("Boltzmann constant must have a positive value!")
 
-def generate_graphs():
+def generate_graphs(update_scheme="synchronous", workers=None, output_path="temp.png", profile=False, trace_path=None):
+    # Commands import their modules when they run, so the headless commands never import pygame (and 'sweep' not even matplotlib) and start quickly.
+    import src.graph_generator as generator
+    from src.profiler import Profiler
+    
     # Set seed.
     np.random.seed(SEED)
     
-    # Generate graphs.
-    generator.nearest_neighbour_coupling_mean_magnetization()
+    # Generate graphs, timing the stages and batches if profiling.
+    profiler = Profiler(enabled=profile or trace_path is not None)
+    generator.nearest_neighbour_coupling_mean_magnetization(update_scheme=update_scheme, workers=workers, output_path=output_path, profiler=profiler)
+    if trace_path is not None:
+        profiler.export_chrome_trace(trace_path)
 
-def run_visualizer():
-    sim = Simulation(width=100, height=100, mode="nearest_neighbour")
-    window(resolution=(1920, 1080), simulation=sim)
+def run_visualizer(width=100, height=100, resolution=(1920, 1080), update_scheme="synchronous", coupling_constant=NEAREST_NEIGHBOUR_COUPLING_CONSTANT, boltzmann_constant=BOLTZMANN_CONSTANT, external_field=0.0, trace_path=None, interaction="nearest_neighbour", next_nearest_coupling_constant=0.0, power_law_exponent=3.0, record_path=None, record_interval=1, replay_path=None, profile=False):
+    # Imported here, see generate_graphs().
+    from src.interactions import create_interaction
+    from src.profiler import Profiler
+    from src.simulation import Simulation
+    from src.trajectory import TrajectoryReader, TrajectoryRecorder
+    from src.visualizer import window
+    
+    # Profile from the start if asked to, (P) toggles the profiler in the window either way.
+    profiler = Profiler(enabled=profile or trace_path is not None)
+    
+    # Replay a recorded trajectory instead of simulating.
+    if replay_path is not None:
+        window(resolution=resolution, trajectory=TrajectoryReader(replay_path), profiler=profiler, trace_path=trace_path)
+        return
+    
+    # Nearest neighbour interaction has its own, faster mode.
+    if interaction == "nearest_neighbour":
+        sim = Simulation(width=width, height=height, mode="nearest_neighbour", update_scheme=update_scheme, coupling_constant=coupling_constant, boltzmann_constant=boltzmann_constant, external_field=external_field)
+    else:
+        interaction = create_interaction(interaction, width, height, coupling_constant, next_nearest_coupling_constant, power_law_exponent)
+        sim = Simulation(width=width, height=height, mode="interaction", update_scheme=update_scheme, coupling_constant=coupling_constant, boltzmann_constant=boltzmann_constant, external_field=external_field, interaction=interaction)
+    
+    # Record the lattice every record_interval sweeps.
+    recorder = None
+    if record_path is not None:
+        recorder = TrajectoryRecorder(record_path, width, height, interval=record_interval)
+        sim.attach_recorder(recorder)
+    try:
+        window(resolution=resolution, simulation=sim, threaded=True, profiler=profiler, trace_path=trace_path)
+    finally:
+        if recorder is not None:
+            recorder.close()
 
-def main():
-    # Verify constants.
-    verify_constants()
+def run_batch_sweep(arguments):
+    # Imported here, see generate_graphs().
+    from src.batch import run_sweep
+    from src.result_store import ResultStore
+    
+    # Explicit temperatures, or evenly spaced temperatures.
+    if arguments.temperatures is not None:
+        temperatures = arguments.temperatures
+    else:
+        start, stop, count = arguments.temperature_range
+        temperatures = np.linspace(start=start, stop=stop, num=int(count))
+    
+    store = ResultStore(arguments.store)
+    try:
+        run_sweep(store, arguments.sizes, temperatures, update_scheme=arguments.update_scheme, exchange_interval=arguments.exchange_interval, coupling_constant=arguments.coupling_constant, boltzmann_constant=arguments.boltzmann_constant, external_field=arguments.external_field, thermalization_sweeps=arguments.thermalization_sweeps, sweeps=arguments.sweeps, seed=arguments.seed, workers=arguments.workers)
+    finally:
+        store.close()
+
+def run_finite_size_scaling(arguments):
+    # Imported here, see generate_graphs().
+    from src.finite_size_scaling import estimate_critical_temperature
+    
+    result = estimate_critical_temperature(sizes=arguments.sizes, temperature_range=arguments.temperature_range, update_scheme=arguments.update_scheme, thermalization_sweeps=arguments.thermalization_sweeps, sweeps=arguments.sweeps, coupling_constant=arguments.coupling_constant, boltzmann_constant=arguments.boltzmann_constant, seed=arguments.seed, workers=arguments.workers, initial_temperatures=arguments.initial_temperatures, refinement_rounds=arguments.refinement_rounds, refinement_points=arguments.refinement_points)
+    
+    # Write result.
+    if result is not None and arguments.output is not None:
+        with open(arguments.output, "w") as file:
+            json.dump(result, file, indent=4)
+        logger.info(f"Saved result to '{arguments.output}'.")
+
+def parse_arguments(arguments=None):
+    parser = argparse.ArgumentParser(prog="python .", description="Ising model simulation and visualization. Without a command, generates the mean spin graph and opens the visualizer.")
+    subparsers = parser.add_subparsers(dest="command")
     
-    # Generate graphs.
-    generate_graphs()
+    # Physical constants, shared by the commands that simulate with them.
+    constants = argparse.ArgumentParser(add_help=False)
+    constants.add_argument("--coupling-constant", type=float, default=NEAREST_NEIGHBOUR_COUPLING_CONSTANT, help="nearest neighbour coupling constant J")
+    constants.add_argument("--boltzmann-constant", type=float, default=BOLTZMANN_CONSTANT, help="Boltzmann constant k_B")
+    constants.add_argument("--external-field", type=float, default=0.0, help="external field H")
+    
+    # Headless parameter sweep.
+    sweep = subparsers.add_parser("sweep", parents=[constants], help="simulate a grid of lattice sizes and temperatures headlessly, into a resumable result store")
+    sweep.add_argument("--sizes", type=int, nargs="+", default=[20], help="lattice sizes L of the L x L lattices")
+    temperatures = sweep.add_mutually_exclusive_group()
+    temperatures.add_argument("--temperatures", type=float, nargs="+", default=None, help="temperatures to simulate")
+    temperatures.add_argument("--temperature-range", type=float, nargs=3, default=[0.1, 5.0, 50], metavar=("START", "STOP", "COUNT"), help="simulate COUNT evenly spaced temperatures from START to STOP")
+    sweep.add_argument("--update-scheme", choices=UPDATE_SCHEMES, default="checkerboard_heat_bath")
+    sweep.add_argument("--exchange-interval", type=int, default=0, help="propose parallel tempering exchanges every this many updates (0: off)")
+    sweep.add_argument("--thermalization-sweeps", type=int, default=200, help="updates before measuring")
+    sweep.add_argument("--sweeps", type=int, default=1000, help="updates to measure over")
+    sweep.add_argument("--seed", type=int, default=SEED)
+    sweep.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    sweep.add_argument("--store", default="results.sqlite", help="SQLite result store, created if it does not exist")
+    
+    # Critical temperature from finite-size scaling.
+    critical_temperature = subparsers.add_parser("critical-temperature", help="estimate the critical temperature from Binder cumulant crossings of several lattice sizes, headlessly")
+    critical_temperature.add_argument("--sizes", type=int, nargs="+", default=[8, 16, 32], help="lattice sizes L of the L x L lattices (at least two)")
+    critical_temperature.add_argument("--temperature-range", type=float, nargs=2, default=None, metavar=("START", "STOP"), help="temperature range to search (default: 0.5 to 2 J / k_B)")
+    critical_temperature.add_argument("--update-scheme", choices=[scheme for scheme in UPDATE_SCHEMES if scheme != "synchronous"], default="swendsen_wang")
+    critical_temperature.add_argument("--thermalization-sweeps", type=int, default=500, help="updates before measuring")
+    critical_temperature.add_argument("--sweeps", type=int, default=2000, help="updates to measure over")
+    critical_temperature.add_argument("--initial-temperatures", type=int, default=8, help="temperatures per lattice size before refining")
+    critical_temperature.add_argument("--refinement-rounds", type=int, default=3)
+    critical_temperature.add_argument("--refinement-points", type=int, default=4, help="temperatures added per lattice size and round")
+    critical_temperature.add_argument("--coupling-constant", type=float, default=NEAREST_NEIGHBOUR_COUPLING_CONSTANT, help="nearest neighbour coupling constant J")
+    critical_temperature.add_argument("--boltzmann-constant", type=float, default=BOLTZMANN_CONSTANT, help="Boltzmann constant k_B")
+    critical_temperature.add_argument("--seed", type=int, default=SEED)
+    critical_temperature.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    critical_temperature.add_argument("--output", default=None, help="write the result as JSON to this file")
+    
+    # Mean spin graph.
+    graph = subparsers.add_parser("graph", help="generate the mean spin vs temperature graph")
+    graph.add_argument("--update-scheme", choices=UPDATE_SCHEMES, default="synchronous")
+    graph.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    graph.add_argument("--output", default="temp.png", help="path of the graph image")
+    graph.add_argument("--profile", action="store_true", help="time the stages of the sweep and every batch, and log the timings")
+    graph.add_argument("--trace", default=None, help="write the profiler timings as a Chrome trace to this file (implies --profile)")
+    
+    # Visualizer.
+    visualize = subparsers.add_parser("visualize", parents=[constants], help="open the visualizer")
+    visualize.add_argument("--width", type=int, default=100)
+    visualize.add_argument("--height", type=int, default=100)
+    visualize.add_argument("--resolution", type=int, nargs=2, default=[1920, 1080], metavar=("WIDTH", "HEIGHT"))
+    visualize.add_argument("--update-scheme", choices=UPDATE_SCHEMES, default=None, help="cluster schemes need the nearest neighbour interaction, long-range interactions a checkerboard scheme (default: synchronous, checkerboard_heat_bath for long-range interactions)")
+    visualize.add_argument("--interaction", choices=INTERACTIONS, default="nearest_neighbour", help="couplings between the spins, J is the nearest neighbour coupling (all_to_all: J / N between every pair, power_law: J / r^exponent)")
+    visualize.add_argument("--next-nearest-coupling-constant", type=float, default=0.0, help="coupling constant of the diagonal neighbours, for the next_nearest_neighbour interaction")
+    visualize.add_argument("--power-law-exponent", type=float, default=3.0, help="exponent of the power_law interaction")
+    visualize.add_argument("--profile", action="store_true", help="start with the profiler and its overlay enabled, and log the timings on exit")
+    visualize.add_argument("--trace", default=None, help="write the profiler timings as a Chrome trace to this file on exit (implies --profile)")
+    trajectory = visualize.add_mutually_exclusive_group()
+    trajectory.add_argument("--record", default=None, metavar="DIR", help="record the lattice to this trajectory directory (appends if it exists)")
+    trajectory.add_argument("--replay", default=None, metavar="DIR", help="replay the trajectory in this directory instead of simulating")
+    visualize.add_argument("--record-interval", type=int, default=1, metavar="N", help="record every N sweeps")
+    
+    arguments = parser.parse_args(arguments)
+    
+    # Parallel tempering assumes the replicas sample the Boltzmann distribution, see ReplicaSimulation.
+    if arguments.command == "sweep" and arguments.exchange_interval > 0 and arguments.update_scheme == "synchronous":
+        parser.error("update scheme 'synchronous' does not sample the Boltzmann distribution, parallel tempering (--exchange-interval) needs another update scheme")
+    
+    # Long-range interactions have no colouring, only the checkerboard schemes (updating one spin at a time) sample them.
+    if arguments.command == "visualize" and arguments.update_scheme is None:
+        arguments.update_scheme = "checkerboard_heat_bath" if arguments.interaction in LONG_RANGE_INTERACTIONS else "synchronous"
+    
+    # Reject update schemes the interaction does not support before opening the window, see Simulation.
+    if arguments.command == "visualize" and arguments.interaction != "nearest_neighbour" and arguments.update_scheme in CLUSTER_UPDATE_SCHEMES:
+        parser.error(f"update scheme '{arguments.update_scheme}' only supports the nearest_neighbour interaction")
+    if arguments.command == "visualize" and arguments.interaction in LONG_RANGE_INTERACTIONS and arguments.update_scheme not in SUBLATTICE_UPDATE_SCHEMES:
+        parser.error(f"update scheme '{arguments.update_scheme}' does not sample the {arguments.interaction} interaction, which needs one of {SUBLATTICE_UPDATE_SCHEMES}")
+    
+    return arguments
+
+def main(arguments=None):
+    arguments = parse_arguments(arguments)
+    
+    # Verify constants.
+    if arguments.command in ["sweep", "critical-temperature", "visualize"]:
+        verify_constants(arguments.coupling_constant, arguments.boltzmann_constant)
+    else:
+        verify_constants()
     
-    # Run visualizer (or generate graph, or etc).
-    run_visualizer()
+    if arguments.command == "sweep":
+        run_batch_sweep(arguments)
+    elif arguments.command == "critical-temperature":
+        run_finite_size_scaling(arguments)
+    elif arguments.command == "graph":
+        generate_graphs(update_scheme=arguments.update_scheme, workers=arguments.workers, output_path=arguments.output, profile=arguments.profile, trace_path=arguments.trace)
+    elif arguments.command == "visualize":
+        run_visualizer(width=arguments.width, height=arguments.height, resolution=tuple(arguments.resolution), update_scheme=arguments.update_scheme, coupling_constant=arguments.coupling_constant, boltzmann_constant=arguments.boltzmann_constant, external_field=arguments.external_field, trace_path=arguments.trace, interaction=arguments.interaction, next_nearest_coupling_constant=arguments.next_nearest_coupling_constant, power_law_exponent=arguments.power_law_exponent, record_path=arguments.record, record_interval=arguments.record_interval, replay_path=arguments.replay, profile=arguments.profile)
+    else:
+        # Generate graphs, then run visualizer.
+        generate_graphs()
+        run_visualizer()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,32 @@
+import numpy as np
+
+def autocorrelation_function(series):
+    """
+    Returns the normalized autocorrelation function of the series for all lags, computed with an FFT.
+    """
+    values = np.asarray(series, dtype=np.float64)
+    values = values - np.mean(values)
+    
+    # Zero pad to twice the length to avoid circular correlation.
+    spectrum = np.fft.rfft(values, n=2 * len(values))
+    autocovariance = np.fft.irfft(spectrum * np.conj(spectrum))[:len(values)]
+    if autocovariance[0] == 0:
+        return np.zeros(len(values))
+    return autocovariance / autocovariance[0]
+
+def integrated_autocorrelation_time(series, window_factor=5):
+    """
+    Returns the integrated autocorrelation time tau = 1 + 2 * sum(rho(t)) of the series, in units of samples. A series of N samples holds about N / tau independent samples.
+    
+    The sum is truncated at the smallest window M with M >= window_factor * tau(M) (Sokal's automatic windowing), as the tail of the autocorrelation function is mostly noise.
+    """
+    if len(series) < 2:
+        return 1.0
+    
+    rho = autocorrelation_function(series)
+    tau = 1 + 2 * np.cumsum(rho[1:])
+    window = np.arange(1, len(rho))
+    converged = window >= window_factor * tau
+    if not converged.any():
+        return float(tau[-1])
+    return float(tau[np.argmax(converged)])
@@ -0,0 +1,106 @@
+from concurrent.futures import as_completed, ProcessPoolExecutor
+
+from loguru import logger
+import numpy as np
+
+from src.autocorrelation import integrated_autocorrelation_time
+from src.constants import *
+from src.observables import series_statistics
+from src.replica_simulation import check_exchange_interval, ReplicaSimulation
+
+# Number of temperatures simulated together as one batch (and one task in the process pool).
+SWEEP_CHUNK_SIZE = 50
+
+def task_seed(index, seed=SEED):
+    """
+    Returns the seed for task number index, derived from seed.
+    """
+    return int(np.random.SeedSequence([seed, index]).generate_state(1)[0])
+
+def run_tasks(function, tasks, workers=None):
+    """
+    Runs function(*task) for every task on a pool of worker processes and yields the results as they finish. With a single worker the tasks run in this process, in order.
+    """
+    if workers == 1:
+        for task in tasks:
+            yield function(*task)
+        return
+    
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(function, *task) for task in tasks]
+        for future in as_completed(futures):
+            yield future.result()
+
+def run_sweep(store, sizes, temperatures, update_scheme="checkerboard_heat_bath", exchange_interval=0, coupling_constant=NEAREST_NEIGHBOUR_COUPLING_CONSTANT, boltzmann_constant=BOLTZMANN_CONSTANT, external_field=0.0, thermalization_sweeps=200, sweeps=1000, seed=SEED, workers=None):
+    """
+    Simulates every combination of (square) lattice size and temperature, and adds the results to the result store. Points that are already stored are skipped, so an interrupted sweep resumes where it stopped and never recomputes a finished point.
+    
+    The temperatures of every lattice size are simulated in batches of SWEEP_CHUNK_SIZE (all at once with parallel tempering), in parallel on a pool of worker processes. Every batch gets its own seed derived from seed and its position in the sweep, so the results do not depend on the number of workers. Parallel tempering with the 'synchronous' update scheme raises a ValueError, see check_exchange_interval().
+    """
+    # Fail before starting the worker processes.
+    check_exchange_interval(update_scheme, exchange_interval)
+    
+    parameters = {
+        "coupling_constant": coupling_constant,
+        "boltzmann_constant": boltzmann_constant,
+        "external_field": external_field,
+        "update_scheme": update_scheme,
+        "exchange_interval": exchange_interval,
+        "thermalization_sweeps": thermalization_sweeps,
+        "sweeps": sweeps,
+        "seed": seed,
+    }
+    
+    # Split the sweep into batches, leaving out the stored points.
+    temperatures = [float(temperature) for temperature in temperatures]
+    chunk_size = len(temperatures) if exchange_interval > 0 else SWEEP_CHUNK_SIZE
+    tasks = []
+    points = 0
+    for size_index, size in enumerate(sizes):
+        for start in range(0, len(temperatures), chunk_size):
+            chunk = temperatures[start:start + chunk_size]
+            missing = [temperature for temperature in chunk if not store.contains({"width": size, "height": size, "temperature": temperature, **parameters})]
+            if len(missing) > 0:
+                tasks.append((size, missing, task_seed(size_index * len(temperatures) + start, seed), parameters))
+                points += len(missing)
+    
+    skipped = len(sizes) * len(temperatures) - points
+    if skipped > 0:
+        logger.info(f"Skipping {skipped} point(s) that are already stored in '{store.path}'.")
+    if points == 0:
+        logger.info("Nothing to simulate, every point is stored already.")
+        return
+    
+    # Simulate and store the results of every batch as soon as it finishes.
+    logger.info(f"Simulating {points} point(s) in {len(tasks)} batch(es)...")
+    done = 0
+    for rows in run_tasks(simulate_batch, tasks, workers):
+        store.add(rows)
+        done += len(rows)
+        logger.info(f"Progress: {done / points * 100.0:.2f}%")
+    logger.info("Done simulating!")
+
+def simulate_series(size, temperatures, seed, parameters):
+    """
+    Simulates a size x size lattice at every temperature in one batch, and returns the average spin and total energy of every update after the thermalization updates, both with shape (temperatures, sweeps).
+    """
+    np.random.seed(seed)
+    sim = ReplicaSimulation(temperatures, width=size, height=size, mode="nearest_neighbour", update_scheme=parameters["update_scheme"], exchange_interval=parameters["exchange_interval"], coupling_constant=parameters["coupling_constant"], boltzmann_constant=parameters["boltzmann_constant"], external_field=parameters["external_field"])
+    for _ in range(parameters["thermalization_sweeps"] + parameters["sweeps"]):
+        sim.update()
+    return sim.average_spin_over_time[:, parameters["thermalization_sweeps"]:], sim.energy_over_time[:, parameters["thermalization_sweeps"]:]
+
+def simulate_batch(size, temperatures, seed, parameters):
+    """
+    Simulates a size x size lattice at every temperature in one batch, and returns a result row (parameters and observables) for every temperature. The observables are measured over the updates after the thermalization updates.
+    """
+    average_spins, energies = simulate_series(size, temperatures, seed, parameters)
+    statistics = series_statistics(average_spins, energies, size * size, temperatures, parameters["boltzmann_constant"])
+    
+    rows = []
+    for replica, temperature in enumerate(temperatures):
+        row = {"width": size, "height": size, "temperature": temperature, **parameters}
+        row.update({name: float(values[replica]) for name, values in statistics.items()})
+        row["autocorrelation_time"] = float(integrated_autocorrelation_time(average_spins[replica]))
+        rows.append(row)
+    return rows
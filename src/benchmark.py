@@ -0,0 +1,268 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+# Render to an offscreen display, the benchmarks never open a window.
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+from loguru import logger
+import numpy as np
+import pygame
+
+from src.constants import *
+import src.graph_generator as generator
+from src.interactions import create_interaction, INTERACTIONS
+from src.simulation import Simulation, UPDATE_SCHEMES
+from src.visualizer import GraphPanel, render_graph
+
+# Default location of the stored baseline.
+BASELINE_PATH = "benchmark_baseline.json"
+
+# Lattice sizes (width and height) of the update and render benchmarks.
+LATTICE_SIZES = [20, 64, 256, 1024, 2048]
+QUICK_LATTICE_SIZES = [20, 64, 256]
+
+# History lengths of the graph benchmarks.
+HISTORY_LENGTHS = [100, 1000, 10000, 100000]
+QUICK_HISTORY_LENGTHS = [100, 1000, 10000]
+
+RENDER_MODES = ["arrow", "rectangle"]
+
+# Temperature of the update benchmarks, above the critical temperature so cluster sizes stay moderate.
+BENCHMARK_TEMPERATURE = 3.0
+
+# Display resolution of the render and graph benchmarks.
+BENCHMARK_RESOLUTION = (1920, 1080)
+
+# Every measurement repeats its call for at least this long (in seconds) and at least MINIMUM_REPEATS times.
+MINIMUM_DURATION = 0.5
+MINIMUM_REPEATS = 3
+
+def measure(function, minimum_duration=MINIMUM_DURATION, minimum_repeats=MINIMUM_REPEATS):
+    """
+    Calls function repeatedly and returns the median duration of one call in seconds.
+    """
+    durations = []
+    start = time.perf_counter()
+    while len(durations) < minimum_repeats or time.perf_counter() - start < minimum_duration:
+        call_start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - call_start)
+    return float(np.median(durations))
+
+def result(value, unit, higher_is_better):
+    return {"value": value, "unit": unit, "higher_is_better": higher_is_better}
+
+def benchmark_update(sizes):
+    """
+    Measures site updates per second of Simulation.update() for every update scheme and lattice size. A Wolff update only flips a single cluster, so for 'wolff' the flipped spins per second are measured instead, see benchmark_wolff_update().
+    """
+    results = {}
+    for update_scheme in UPDATE_SCHEMES:
+        for size in sizes:
+            np.random.seed(SEED)
+            sim = Simulation(width=size, height=size, mode="nearest_neighbour", update_scheme=update_scheme)
+            sim.update(BENCHMARK_TEMPERATURE)
+            if update_scheme == "wolff":
+                flipped_spins_per_second = benchmark_wolff_update(sim)
+                results[f"update/{update_scheme}/{size}"] = result(flipped_spins_per_second, "flipped spins/s", True)
+                logger.info(f"Update {update_scheme} {size}x{size}: {flipped_spins_per_second:.3e} flipped spins/s.")
+                continue
+            duration = measure(lambda: sim.update(BENCHMARK_TEMPERATURE))
+            results[f"update/{update_scheme}/{size}"] = result(size * size / duration, "site updates/s", True)
+            logger.info(f"Update {update_scheme} {size}x{size}: {size * size / duration:.3e} site updates/s.")
+    return results
+
+def benchmark_wolff_update(sim, minimum_duration=MINIMUM_DURATION, minimum_repeats=MINIMUM_REPEATS):
+    """
+    Returns the spins flipped per second by Simulation.update() with the 'wolff' scheme, over all updates of at least minimum_duration seconds. Cluster sizes vary from update to update, so the total of flipped spins is divided by the total duration.
+    """
+    # Count the spins of every flipped cluster on their way to the running totals.
+    flipped_spins = [0]
+    add_cluster_flips = sim.add_cluster_flips
+    def counting_add_cluster_flips(flipped):
+        flipped_spins[0] += int(np.count_nonzero(flipped))
+        add_cluster_flips(flipped)
+    sim.add_cluster_flips = counting_add_cluster_flips
+    
+    updates = 0
+    start = time.perf_counter()
+    while updates < minimum_repeats or time.perf_counter() - start < minimum_duration:
+        sim.update(BENCHMARK_TEMPERATURE)
+        updates += 1
+    return flipped_spins[0] / (time.perf_counter() - start)
+
+def benchmark_interaction(sizes):
+    """
+    Measures sites per second of the local field computation of every interaction and lattice size, which dominates the updates of the 'interaction' mode.
+    """
+    results = {}
+    for name in INTERACTIONS:
+        for size in sizes:
+            np.random.seed(SEED)
+            interaction = create_interaction(name, size, size, NEAREST_NEIGHBOUR_COUPLING_CONSTANT, 0.5)
+            spins = np.random.choice(np.array([-1, +1], dtype=np.int8), size=(size, size))
+            duration = measure(lambda: interaction.local_field(spins))
+            results[f"interaction/{name}/{size}"] = result(size * size / duration, "sites/s", True)
+            logger.info(f"Local field {name} {size}x{size}: {size * size / duration:.3e} sites/s.")
+    return results
+
+def benchmark_render(sizes):
+    """
+    Measures the duration of Simulation.render() for every render mode and lattice size, at zoom 1, zoomed in to zoom 16 (a few huge spins) and zoomed out to fit the whole lattice on the display.
+    """
+    display = pygame.Surface(BENCHMARK_RESOLUTION)
+    results = {}
+    for render_mode in RENDER_MODES:
+        for size in sizes:
+            np.random.seed(SEED)
+            sim = Simulation(width=size, height=size, mode="nearest_neighbour")
+            fit_zoom = min(BENCHMARK_RESOLUTION) / (size * 50)
+            for zoom_name, zoom in [("zoom_1", 1), ("zoom_16", 16), ("fit", fit_zoom)]:
+                duration = measure(lambda: sim.render(display, None, BENCHMARK_RESOLUTION, zoom, render_mode))
+                results[f"render/{render_mode}/{zoom_name}/{size}"] = result(duration * 1000, "ms", False)
+                logger.info(f"Render {render_mode} {size}x{size} ({zoom_name}): {duration * 1000:.2f} ms.")
+    return results
+
+def benchmark_graph(history_lengths):
+    """
+    Measures the duration of render_graph() on a full history, and of a GraphPanel frame (one new point and a render) after the history, for every history length.
+    """
+    display = pygame.Surface(BENCHMARK_RESOLUTION)
+    small_font = pygame.freetype.SysFont("Courier New", 15)
+    big_font = pygame.freetype.SysFont("Courier New", 20)
+    graph_arguments = {"position": (20, BENCHMARK_RESOLUTION[1] / 2 + 100), "size": (400, 200), "title": "Average Spin over Time", "x_axis_label": "Time", "y_axis_label": "Average Spin"}
+    
+    results = {}
+    for length in history_lengths:
+        np.random.seed(SEED)
+        x = np.arange(length)
+        y = np.cumsum(np.random.normal(scale=0.01, size=length))
+        
+        # Full redraw.
+        duration = measure(lambda: render_graph(display, small_font, big_font, x, y, **graph_arguments))
+        results[f"graph/render_graph/{length}"] = result(duration * 1000, "ms", False)
+        logger.info(f"render_graph() with {length} points: {duration * 1000:.2f} ms.")
+        
+        # Incremental frame.
+        graph = GraphPanel(small_font, big_font, **graph_arguments)
+        graph.update(x, y)
+        next_x = [length]
+        def frame():
+            graph.add(next_x[0], float(y[-1]))
+            graph.render(display)
+            next_x[0] += 1
+        duration = measure(frame)
+        results[f"graph/graph_panel/{length}"] = result(duration * 1000, "ms", False)
+        logger.info(f"GraphPanel frame after {length} points: {duration * 1000:.2f} ms.")
+    return results
+
+def benchmark_sweep(workers):
+    """
+    Measures the duration of the full mean magnetization sweep, including the plot.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        np.random.seed(SEED)
+        start = time.perf_counter()
+        generator.nearest_neighbour_coupling_mean_magnetization(workers=workers, output_path=os.path.join(directory, "sweep.png"))
+        duration = time.perf_counter() - start
+    logger.info(f"Mean magnetization sweep: {duration:.2f} s.")
+    return {"sweep/nearest_neighbour_coupling_mean_magnetization": result(duration, "s", False)}
+
+def compare(results, baseline, threshold):
+    """
+    Compares the results to the baseline results and returns the names of the benchmarks that got worse by more than the threshold (a fraction).
+    """
+    regressions = []
+    for name, current in results.items():
+        # Benchmarks that changed their unit cannot be compared.
+        if name not in baseline or baseline[name]["unit"] != current["unit"]:
+            continue
+        reference = baseline[name]["value"]
+        if reference == 0:
+            continue
+        
+        # Ratio above one means improvement.
+        ratio = current["value"] / reference if current["higher_is_better"] else reference / current["value"]
+        current["baseline"] = reference
+        current["ratio"] = ratio
+        message = f"{name}: {current['value']:.4g} {current['unit']} (baseline {reference:.4g}, {(ratio - 1) * 100:+.1f}%)."
+        if ratio < 1 - threshold:
+            logger.warning(f"Regression: {message}")
+            regressions.append(name)
+        else:
+            logger.info(message)
+    return regressions
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(prog="python -m src.benchmark", description="Benchmarks update, interaction, render, graph and sweep throughput.")
+    parser.add_argument("--only", nargs="+", choices=["update", "interaction", "render", "graph", "sweep"], default=["update", "interaction", "render", "graph", "sweep"], help="benchmarks to run")
+    parser.add_argument("--quick", action="store_true", help="skip the largest lattices and histories")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes of the sweep benchmark (default: all cores)")
+    parser.add_argument("--output", default=None, help="write the results as JSON to this file (default: standard output)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline to compare to, and to write with --save-baseline")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative slowdown reported as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="exit with status 1 if any benchmark regressed")
+    arguments = parser.parse_args(arguments)
+    
+    pygame.init()
+    sizes = QUICK_LATTICE_SIZES if arguments.quick else LATTICE_SIZES
+    history_lengths = QUICK_HISTORY_LENGTHS if arguments.quick else HISTORY_LENGTHS
+    
+    # Run benchmarks.
+    results = {}
+    if "update" in arguments.only:
+        results.update(benchmark_update(sizes))
+    if "interaction" in arguments.only:
+        results.update(benchmark_interaction(sizes))
+    if "render" in arguments.only:
+        results.update(benchmark_render(sizes))
+    if "graph" in arguments.only:
+        results.update(benchmark_graph(history_lengths))
+    if "sweep" in arguments.only:
+        results.update(benchmark_sweep(arguments.workers))
+    
+    # Compare to baseline.
+    regressions = []
+    if not arguments.save_baseline and os.path.exists(arguments.baseline):
+        with open(arguments.baseline) as file:
+            baseline = json.load(file)["results"]
+        regressions = compare(results, baseline, arguments.threshold)
+    
+    report = {
+        "metadata": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pygame": pygame.version.ver,
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+            "quick": arguments.quick,
+        },
+        "results": results,
+        "regressions": regressions,
+    }
+    
+    # Write results.
+    if arguments.output is None:
+        json.dump(report, sys.stdout, indent=4)
+        print()
+    else:
+        with open(arguments.output, "w") as file:
+            json.dump(report, file, indent=4)
+    if arguments.save_baseline:
+        with open(arguments.baseline, "w") as file:
+            json.dump(report, file, indent=4)
+        logger.info(f"Saved baseline to '{arguments.baseline}'.")
+    
+    pygame.quit()
+    return 1 if arguments.fail_on_regression and regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
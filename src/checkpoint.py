@@ -0,0 +1,158 @@
+import json
+import os
+import tempfile
+
+from loguru import logger
+import numpy as np
+
+from src.simulation import Simulation
+
+# File layout: magic, header length (8 bytes, little endian), JSON header, arrays. Every array starts at a multiple of ARRAY_ALIGNMENT bytes, so it can be memory-mapped directly.
+CHECKPOINT_MAGIC = b"ISINGCKP"
+CHECKPOINT_VERSION = 1
+ARRAY_ALIGNMENT = 64
+
+class Checkpointer:
+    """
+    Saves a checkpoint of a simulation every interval sweeps. Call save_if_due() after every update.
+    """
+    
+    def __init__(self, path, interval, packed=True):
+        self.path = path
+        self.interval = interval
+        self.packed = packed
+    
+    def save_if_due(self, simulation):
+        if simulation.sweeps > 0 and simulation.sweeps % self.interval == 0:
+            save_checkpoint(simulation, self.path, packed=self.packed)
+
+def save_checkpoint(simulation, path, packed=True):
+    """
+    Saves the lattice, running totals, observables and the state of the global random number generator to path. The lattice is stored as packed bits (one bit per spin), or as int8 if not packed, which can be memory-mapped without unpacking when loading.
+    
+    The file is written to a temporary file first and then renamed, so an interrupted save never leaves a partial checkpoint behind.
+    """
+    observables = simulation.observables
+    history = observables.average_spin_history
+    random_state = np.random.get_state()
+    
+    metadata = {
+        "width": simulation.width,
+        "height": simulation.height,
+        "mode": simulation.mode,
+        "update_scheme": simulation.update_scheme,
+        "check_totals": simulation.check_totals,
+        "coupling_constant": simulation.coupling_constant,
+        "boltzmann_constant": simulation.boltzmann_constant,
+        "external_field": simulation.external_field,
+        "temperature": simulation.temperature,
+        "sweeps": simulation.sweeps,
+        "total_magnetization": simulation.total_magnetization,
+        "total_energy": simulation.total_energy,
+        "spin_encoding": "packbits" if packed else "int8",
+        "history_count": history.count,
+        "running_statistics": {name: [statistics.count, statistics.mean, statistics.sum_of_squared_deviations] for name, statistics in observables.get_running_statistics().items()},
+        "random_state": [random_state[0], random_state[2], random_state[3], random_state[4]],
+    }
+    arrays = {
+        "spins": np.packbits(simulation.spins > 0) if packed else simulation.spins,
+        "history": history.data,
+        "random_state_keys": random_state[1],
+    }
+    write_checkpoint(path, metadata, arrays)
+
+def load_checkpoint(path, restore_random_state=True, interaction=None):
+    """
+    Loads a simulation from a checkpoint. With restore_random_state the global random number generator continues where it was when the checkpoint was saved, so the resumed run is identical to an uninterrupted run. Interactions are not stored, a checkpoint of the 'interaction' mode needs the interaction it was saved with.
+    
+    The arrays are memory-mapped. An int8 lattice is used as a copy-on-write map of the file, so even a huge lattice resumes without reading it up front.
+    """
+    metadata, arrays = read_checkpoint(path)
+    width, height = metadata["width"], metadata["height"]
+    
+    # Create simulation.
+    history = arrays["history"]
+    # Checkpoints from before the constants were stored used the defaults.
+    constants = {name: metadata[name] for name in ["coupling_constant", "boltzmann_constant", "external_field"] if name in metadata}
+    simulation = Simulation(width=width, height=height, mode=metadata["mode"], update_scheme=metadata["update_scheme"], history_capacity=len(history), check_totals=metadata["check_totals"], interaction=interaction, **constants)
+    
+    # Restore lattice.
+    if metadata["spin_encoding"] == "packbits":
+        simulation.spins = np.unpackbits(arrays["spins"], count=width * height).reshape(height, width).astype(np.int8) * 2 - 1
+    else:
+        simulation.spins = arrays["spins"]
+    
+    # Restore totals and observables.
+    simulation.temperature = metadata["temperature"]
+    simulation.sweeps = metadata["sweeps"]
+    simulation.total_magnetization = metadata["total_magnetization"]
+    simulation.total_energy = metadata["total_energy"]
+    simulation.observables.average_spin_history.data[:] = history
+    simulation.observables.average_spin_history.count = metadata["history_count"]
+    for name, statistics in simulation.observables.get_running_statistics().items():
+        statistics.count, statistics.mean, statistics.sum_of_squared_deviations = metadata["running_statistics"][name]
+    
+    # Restore random number generator.
+    if restore_random_state:
+        algorithm, position, has_gauss, cached_gaussian = metadata["random_state"]
+        np.random.set_state((algorithm, np.array(arrays["random_state_keys"], dtype=np.uint32), position, has_gauss, cached_gaussian))
+    
+    return simulation
+
+def write_checkpoint(path, metadata, arrays):
+    """
+    Atomically writes metadata and arrays to a checkpoint file.
+    """
+    # Lay out arrays.
+    array_headers = {}
+    offset = 0
+    for name, array in arrays.items():
+        array_headers[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset = align(offset + array.nbytes)
+    header = json.dumps({"version": CHECKPOINT_VERSION, "metadata": metadata, "arrays": array_headers}).encode("utf-8")
+    data_start = align(len(CHECKPOINT_MAGIC) + 8 + len(header))
+    
+    # Write to a temporary file in the same directory, then replace the checkpoint in one go.
+    directory = os.path.dirname(os.path.abspath(path))
+    file_descriptor, temporary_path = tempfile.mkstemp(dir=directory, prefix=".checkpoint-")
+    try:
+        with os.fdopen(file_descriptor, "wb") as file:
+            file.write(CHECKPOINT_MAGIC)
+            file.write(len(header).to_bytes(8, "little"))
+            file.write(header)
+            for name, array in arrays.items():
+                file.seek(data_start + array_headers[name]["offset"])
+                file.write(np.ascontiguousarray(array).tobytes())
+            file.truncate(data_start + offset)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+    logger.debug(f"Saved checkpoint to '{path}'.")
+
+def read_checkpoint(path):
+    """
+    Returns the metadata and the (memory-mapped, copy-on-write) arrays of a checkpoint file.
+    """
+    with open(path, "rb") as file:
+        if file.read(len(CHECKPOINT_MAGIC)) != CHECKPOINT_MAGIC:
+            raise ValueError(f"'{path}' is not a checkpoint file.")
+        header_length = int.from_bytes(file.read(8), "little")
+        header = json.loads(file.read(header_length).decode("utf-8"))
+    if header["version"] != CHECKPOINT_VERSION:
+        raise ValueError(f"Checkpoint version {header['version']} is not supported (expected version {CHECKPOINT_VERSION}).")
+    data_start = align(len(CHECKPOINT_MAGIC) + 8 + header_length)
+    
+    arrays = {}
+    for name, array_header in header["arrays"].items():
+        shape = tuple(array_header["shape"])
+        if np.prod(shape) == 0:
+            arrays[name] = np.zeros(shape, dtype=np.dtype(array_header["dtype"]))
+        else:
+            arrays[name] = np.memmap(path, dtype=np.dtype(array_header["dtype"]), mode="c", offset=data_start + array_header["offset"], shape=shape)
+    return header["metadata"], arrays
+
+def align(offset):
+    return -(-offset // ARRAY_ALIGNMENT) * ARRAY_ALIGNMENT
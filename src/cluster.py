@@ -0,0 +1,118 @@
+import numpy as np
+
+def bond_probability(temperature, coupling_constant, boltzmann_constant):
+    """
+    Returns the probability of adding a satisfied bond to a cluster, 1 - exp(-|J| / kT).
+    
+    The single spin update schemes accept a flip with exp(-dU / kT) where dU = J * S_i * sum(S_j), which is the Boltzmann weight of a lattice with coupling J/2 per bond. The usual 1 - exp(-2 J_bond / kT) with J_bond = J/2 therefore samples the same distribution.
+    """
+    return 1 - np.exp(-abs(coupling_constant) / (temperature * boltzmann_constant))
+
+def satisfied_bonds(spins, coupling_constant):
+    """
+    Returns boolean arrays of the horizontal (height, width - 1) and vertical (height - 1, width) bonds that lower the energy, e.g. aligned spins for positive J and anti-aligned spins for negative J.
+    """
+    bond_sign = 1 if coupling_constant >= 0 else -1
+    horizontal_bonds = spins[:, :-1] * spins[:, 1:] == bond_sign
+    vertical_bonds = spins[:-1, :] * spins[1:, :] == bond_sign
+    return horizontal_bonds, vertical_bonds
+
+def wolff_update(spins, temperature, coupling_constant, boltzmann_constant, external_field=0.0):
+    """
+    Grows a single cluster from a random spin and flips it in place. Returns a boolean mask of the flipped spins.
+    
+    The bonds do not know about the external field, in a field the flip is accepted with the Metropolis probability of the change in field energy instead of always.
+    """
+    height, width = spins.shape
+    add_probability = bond_probability(temperature, coupling_constant, boltzmann_constant)
+    bond_sign = 1 if coupling_constant >= 0 else -1
+    
+    # Pick a random seed spin.
+    seed = (np.random.randint(height), np.random.randint(width))
+    in_cluster = np.zeros(spins.shape, dtype=bool)
+    in_cluster[seed] = True
+    
+    # Grow the cluster by adding satisfied bonds to neighbours with the bond probability.
+    stack = [seed]
+    while stack:
+        y, x = stack.pop()
+        for neighbour_y, neighbour_x in ((y, x - 1), (y, x + 1), (y - 1, x), (y + 1, x)):
+            if neighbour_x < 0 or neighbour_x >= width or neighbour_y < 0 or neighbour_y >= height:
+                continue
+            if in_cluster[neighbour_y, neighbour_x]:
+                continue
+            if spins[neighbour_y, neighbour_x] * spins[y, x] != bond_sign:
+                continue
+            if np.random.random() < add_probability:
+                in_cluster[neighbour_y, neighbour_x] = True
+                stack.append((neighbour_y, neighbour_x))
+    
+    # Reject the flip with the Metropolis probability of the change in field energy, 2H * sum(S_i) over the cluster.
+    if external_field != 0:
+        delta_energy = 2 * external_field * int(np.sum(spins[in_cluster], dtype=np.int64))
+        if np.random.random() >= np.exp(-delta_energy / (temperature * boltzmann_constant)):
+            in_cluster[:] = False
+    
+    # Flip the cluster.
+    spins[in_cluster] *= -1
+    return in_cluster
+
+def swendsen_wang_update(spins, temperature, coupling_constant, boltzmann_constant, external_field=0.0):
+    """
+    Activates every satisfied bond with the bond probability, labels the resulting clusters and flips each cluster with probability 1/2, in place. Returns a boolean mask of the flipped spins.
+    
+    In an external field every cluster is flipped with the heat bath probability 1 / (1 + exp(dU / kT)) of the change in field energy dU = 2H * sum(S_i) over the cluster instead.
+    """
+    add_probability = bond_probability(temperature, coupling_constant, boltzmann_constant)
+    
+    # Activate bonds.
+    horizontal_bonds, vertical_bonds = satisfied_bonds(spins, coupling_constant)
+    horizontal_bonds &= np.random.random(horizontal_bonds.shape) < add_probability
+    vertical_bonds &= np.random.random(vertical_bonds.shape) < add_probability
+    
+    # Label clusters and flip every cluster with probability 1/2, or the heat bath probability in a field.
+    labels = label_clusters(horizontal_bonds, vertical_bonds)
+    flip_probability = 0.5
+    if external_field != 0:
+        cluster_magnetization = np.bincount(labels.ravel(), weights=spins.ravel(), minlength=labels.size)
+        with np.errstate(over="ignore"):
+            flip_probability = 1 / (1 + np.exp(2 * external_field * cluster_magnetization / (temperature * boltzmann_constant)))
+    flip_cluster = np.random.random(labels.size) < flip_probability
+    flipped = flip_cluster[labels]
+    spins[flipped] *= -1
+    return flipped
+
+def label_clusters(horizontal_bonds, vertical_bonds):
+    """
+    Labels the clusters formed by the active bonds, using a vectorized union-find. Every spin is labelled with the smallest flat index in its cluster.
+    """
+    height, width = vertical_bonds.shape[0] + 1, horizontal_bonds.shape[1] + 1
+    index = np.arange(height * width).reshape(height, width)
+    
+    # Flat indices of both ends of every active bond.
+    bond_start = np.concatenate([index[:, :-1][horizontal_bonds], index[:-1, :][vertical_bonds]])
+    bond_end = np.concatenate([index[:, 1:][horizontal_bonds], index[1:, :][vertical_bonds]])
+    
+    # Every spin starts out as the root of its own cluster.
+    labels = np.arange(height * width)
+    while True:
+        # Bonds connecting the same root are done for good, roots only ever merge.
+        start_root = labels[bond_start]
+        end_root = labels[bond_end]
+        unmerged = start_root != end_root
+        if not unmerged.any():
+            break
+        bond_start, bond_end = bond_start[unmerged], bond_end[unmerged]
+        start_root, end_root = start_root[unmerged], end_root[unmerged]
+        
+        # Hook the larger root onto the smallest root it is bonded to.
+        np.minimum.at(labels, np.maximum(start_root, end_root), np.minimum(start_root, end_root))
+        
+        # Pointer jumping, until every spin points directly at its root.
+        while True:
+            parents = labels[labels]
+            if np.array_equal(parents, labels):
+                break
+            labels = parents
+    
+    return labels.reshape(height, width)
@@ -0,0 +1,186 @@
+from loguru import logger
+import numpy as np
+
+from src.batch import run_tasks, simulate_series, task_seed
+from src.constants import *
+
+# Number of temperatures every lattice size starts with, evenly spaced over the temperature range.
+INITIAL_TEMPERATURES = 8
+
+# Every refinement round adds REFINEMENT_POINTS temperatures per lattice size, in the intervals where the observables change fastest.
+REFINEMENT_ROUNDS = 3
+REFINEMENT_POINTS = 4
+
+# Number of temperatures the reweighted curves are evaluated at.
+REWEIGHTING_RESOLUTION = 1000
+
+# Number of blocks the time series are split into for jackknife error estimates.
+JACKKNIFE_BLOCKS = 20
+
+def estimate_critical_temperature(sizes=[8, 16, 32], temperature_range=None, update_scheme="swendsen_wang", thermalization_sweeps=500, sweeps=2000, coupling_constant=NEAREST_NEIGHBOUR_COUPLING_CONSTANT, boltzmann_constant=BOLTZMANN_CONSTANT, seed=SEED, workers=None, initial_temperatures=INITIAL_TEMPERATURES, refinement_rounds=REFINEMENT_ROUNDS, refinement_points=REFINEMENT_POINTS):
+    """
+    Estimates the critical temperature from the crossings of the Binder cumulant curves of several lattice sizes (finite-size scaling), without external field.
+    
+    Every lattice size starts out with a coarse grid of temperatures over temperature_range (by default 0.5 to 2 J / k_B). Every refinement round adds temperatures in the intervals where the susceptibility or the Binder cumulant changes fastest, so the simulations concentrate around the transition. Between the simulated temperatures the curves are interpolated by single histogram reweighting of the nearest simulated temperature, which requires an update scheme that samples the Boltzmann distribution (every scheme except 'synchronous').
+    
+    The estimate is the Binder cumulant crossing of the two largest sizes, its error follows from jackknife resampling of JACKKNIFE_BLOCKS blocks of every time series. Returns a dict with the estimate and error, the crossing of every pair of consecutive sizes, the susceptibility peak of every size and the simulated temperatures of every size.
+    """
+    if update_scheme == "synchronous":
+        logger.critical("The 'synchronous' update scheme does not sample the Boltzmann distribution, histogram reweighting does not apply to it!")
+        return None
+    if len(sizes) < 2:
+        logger.critical("Finite-size scaling needs at least two lattice sizes!")
+        return None
+    if temperature_range is None:
+        temperature_range = (0.5 * coupling_constant / boltzmann_constant, 2.0 * coupling_constant / boltzmann_constant)
+    
+    sizes = sorted(sizes)
+    parameters = {
+        "coupling_constant": coupling_constant,
+        "boltzmann_constant": boltzmann_constant,
+        "external_field": 0.0,
+        "update_scheme": update_scheme,
+        "exchange_interval": 0,
+        "thermalization_sweeps": thermalization_sweeps,
+        "sweeps": sweeps,
+    }
+    
+    # Simulated temperatures, average spin and energy series of every size, sorted by temperature.
+    data = {size: (np.empty(0), np.empty((0, sweeps)), np.empty((0, sweeps))) for size in sizes}
+    new_temperatures = {size: np.linspace(temperature_range[0], temperature_range[1], initial_temperatures) for size in sizes}
+    tasks_created = 0
+    for refinement_round in range(refinement_rounds + 1):
+        # Simulate every new temperature of every size as its own task, every task gets its own seed.
+        tasks = [(size, float(temperature), parameters) for size in sizes for temperature in new_temperatures[size]]
+        tasks = [task + (task_seed(tasks_created + index, seed),) for index, task in enumerate(tasks)]
+        tasks_created += len(tasks)
+        logger.info(f"Simulating {len(tasks)} temperature(s) (round {refinement_round + 1}/{refinement_rounds + 1})...")
+        for size, temperature, average_spins, energies in run_tasks(simulate_temperature, tasks, workers):
+            temperatures = np.append(data[size][0], temperature)
+            order = np.argsort(temperatures)
+            data[size] = (temperatures[order], np.vstack([data[size][1], average_spins])[order], np.vstack([data[size][2], energies])[order])
+        
+        if refinement_round == refinement_rounds:
+            break
+        
+        # Refine where the observables change fastest.
+        for size in sizes:
+            temperatures, average_spins, energies = data[size]
+            susceptibility, binder_cumulant = moments_to_observables(*series_moments(average_spins, energies, np.zeros(len(temperatures)), 0.0), size * size, temperatures, boltzmann_constant)
+            new_temperatures[size] = refine_temperatures(temperatures, susceptibility, binder_cumulant, refinement_points)
+    
+    # Reweighted curves on a fine grid covering the simulated range, and the crossing of every pair of consecutive sizes.
+    targets = np.linspace(temperature_range[0], temperature_range[1], REWEIGHTING_RESOLUTION)
+    crossings, susceptibility_peaks = find_crossings(data, sizes, targets, boltzmann_constant)
+    
+    # Jackknife, leave out one block of every time series at a time.
+    block = np.arange(sweeps) * JACKKNIFE_BLOCKS // sweeps
+    jackknife_crossings = []
+    for left_out in range(JACKKNIFE_BLOCKS):
+        keep = block != left_out
+        jackknife_data = {size: (temperatures, average_spins[:, keep], energies[:, keep]) for size, (temperatures, average_spins, energies) in data.items()}
+        jackknife_crossings.append(find_crossings(jackknife_data, sizes, targets, boltzmann_constant)[0])
+    jackknife_crossings = np.array(jackknife_crossings)
+    with np.errstate(invalid="ignore"):
+        errors = np.sqrt((JACKKNIFE_BLOCKS - 1) / JACKKNIFE_BLOCKS * np.sum((jackknife_crossings - np.mean(jackknife_crossings, axis=0)) ** 2, axis=0))
+    
+    pairs = [(sizes[index], sizes[index + 1], float(crossings[index]), float(errors[index])) for index in range(len(sizes) - 1)]
+    for small, large, crossing, error in pairs:
+        logger.info(f"Binder cumulant crossing of L={small} and L={large}: T = {crossing:.4f} +- {error:.4f}.")
+    for size, peak in susceptibility_peaks.items():
+        logger.info(f"Susceptibility peak of L={size}: T = {peak:.4f}.")
+    logger.info(f"Critical temperature: {pairs[-1][2]:.4f} +- {pairs[-1][3]:.4f} (from L={pairs[-1][0]} and L={pairs[-1][1]}, {sum(len(data[size][0]) for size in sizes)} simulated temperatures).")
+    
+    return {
+        "critical_temperature": pairs[-1][2],
+        "error": pairs[-1][3],
+        "crossings": pairs,
+        "susceptibility_peaks": susceptibility_peaks,
+        "temperatures": {size: data[size][0].tolist() for size in sizes},
+    }
+
+def simulate_temperature(size, temperature, parameters, seed):
+    """
+    Simulates a size x size lattice at a single temperature, and returns the size, the temperature and the average spin and total energy series after thermalization.
+    """
+    average_spins, energies = simulate_series(size, [temperature], seed, parameters)
+    return size, temperature, average_spins[0], energies[0]
+
+def refine_temperatures(temperatures, susceptibility, binder_cumulant, count):
+    """
+    Returns the midpoints of the count intervals between neighbouring (sorted) temperatures over which the susceptibility and the Binder cumulant change most, both relative to their range.
+    """
+    def relative_change(values):
+        value_range = np.max(values) - np.min(values)
+        return np.abs(np.diff(values)) / value_range if value_range > 0 else np.zeros(len(values) - 1)
+    
+    change = relative_change(susceptibility) + relative_change(binder_cumulant)
+    intervals = np.sort(np.argsort(change)[::-1][:count])
+    return (temperatures[intervals] + temperatures[intervals + 1]) / 2
+
+def series_moments(average_spins, energies, beta_shift, energy_scale):
+    """
+    Returns the reweighted moments <|m|>, <m^2> and <m^4> of every row of the (points, sweeps) series, sampled at inverse temperature beta and reweighted to beta + beta_shift (one shift per row) with weights exp(-beta_shift * E).
+    """
+    log_weights = -beta_shift[:, None] * (energies - energy_scale)
+    weights = np.exp(log_weights - np.max(log_weights, axis=1, keepdims=True))
+    weights /= np.sum(weights, axis=1, keepdims=True)
+    absolute_magnetization = np.sum(weights * np.abs(average_spins), axis=1)
+    magnetization_squared = np.sum(weights * average_spins ** 2, axis=1)
+    magnetization_fourth = np.sum(weights * average_spins ** 4, axis=1)
+    return absolute_magnetization, magnetization_squared, magnetization_fourth
+
+def moments_to_observables(absolute_magnetization, magnetization_squared, magnetization_fourth, sites, temperatures, boltzmann_constant):
+    """
+    Returns the susceptibility and Binder cumulant from the moments, see Observables.
+    """
+    susceptibility = sites / (boltzmann_constant * temperatures) * (magnetization_squared - absolute_magnetization ** 2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        binder_cumulant = np.where(magnetization_squared == 0, 0.0, 1 - magnetization_fourth / (3 * magnetization_squared ** 2))
+    return susceptibility, binder_cumulant
+
+def reweighted_observables(temperatures, average_spins, energies, targets, sites, boltzmann_constant):
+    """
+    Returns the susceptibility and Binder cumulant at every target temperature, reweighted from the nearest simulated temperature.
+    """
+    nearest = np.argmin(np.abs(targets[:, None] - temperatures[None, :]), axis=1)
+    beta_shift = 1 / (boltzmann_constant * targets) - 1 / (boltzmann_constant * temperatures[nearest])
+    
+    # Reweight relative to the mean energy of every series, so the weights stay finite.
+    energy_scale = np.mean(energies, axis=1)[nearest][:, None]
+    moments = series_moments(average_spins[nearest], energies[nearest], beta_shift, energy_scale)
+    return moments_to_observables(*moments, sites, targets, boltzmann_constant)
+
+def find_crossings(data, sizes, targets, boltzmann_constant):
+    """
+    Returns the Binder cumulant crossing of every pair of consecutive sizes (NaN if the curves do not cross), and the susceptibility peak of every size, from the reweighted curves at the target temperatures.
+    """
+    curves = {}
+    susceptibility_peaks = {}
+    for size in sizes:
+        temperatures, average_spins, energies = data[size]
+        
+        # Only reweight within the simulated range.
+        inside = (targets >= temperatures[0]) & (targets <= temperatures[-1])
+        susceptibility, binder_cumulant = reweighted_observables(temperatures, average_spins, energies, targets[inside], size * size, boltzmann_constant)
+        curves[size] = (targets[inside], binder_cumulant)
+        susceptibility_peaks[size] = float(targets[inside][np.argmax(susceptibility)])
+    
+    crossings = []
+    for small, large in zip(sizes[:-1], sizes[1:]):
+        crossings.append(binder_crossing(*curves[small], *curves[large], susceptibility_peaks[large]))
+    return np.array(crossings), susceptibility_peaks
+
+def binder_crossing(small_temperatures, small_binder_cumulant, large_temperatures, large_binder_cumulant, reference_temperature):
+    """
+    Returns the temperature at which the Binder cumulant of the larger lattice drops below that of the smaller lattice, linearly interpolated between the target temperatures. If the curves cross more than once (noise), the crossing closest to the reference temperature is returned, NaN if they do not cross.
+    """
+    temperatures = np.intersect1d(small_temperatures, large_temperatures)
+    difference = large_binder_cumulant[np.isin(large_temperatures, temperatures)] - small_binder_cumulant[np.isin(small_temperatures, temperatures)]
+    
+    # Below the critical temperature the larger lattice is more ordered, above it less.
+    candidates = np.flatnonzero((difference[:-1] > 0) & (difference[1:] <= 0))
+    if len(candidates) == 0:
+        return np.nan
+    crossings = temperatures[candidates] + difference[candidates] / (difference[candidates] - difference[candidates + 1]) * (temperatures[candidates + 1] - temperatures[candidates])
+    return float(crossings[np.argmin(np.abs(crossings - reference_temperature))])
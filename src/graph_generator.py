@@ -1,93 +1,128 @@
+import time
+
 from loguru import logger
 import matplotlib.pyplot as plt
 import numpy as np
 
+from src.batch import run_tasks, task_seed, SWEEP_CHUNK_SIZE
 from src.constants import *
-from src.simulation import Simulation
+from src.mean_field import get_mean_field_magnetization, solve_mean_field_magnetization
+from src.profiler import Profiler
+from src.replica_simulation import check_exchange_interval, ReplicaSimulation
 
 PRIMARY_COLOR = "royalblue"
 SECONDARY_COLOR = "indianred"
 
-def nearest_neighbour_coupling_mean_magnetization():
+def nearest_neighbour_coupling_mean_magnetization(update_scheme="synchronous", workers=None, exchange_interval=0, output_path="temp.png", profiler=None):
+    """
+    Generates the mean spin vs temperature graph. The temperatures are simulated in batches of SWEEP_CHUNK_SIZE, in parallel on a pool of worker processes (all cores if workers is None). Every batch gets its own seed derived from SEED, so the results do not depend on the number of workers.
+    
+    With a non-zero exchange_interval the whole temperature ladder is simulated as one batch with parallel tempering instead, which needs an update scheme other than 'synchronous' (raises a ValueError otherwise). The graph is saved to output_path.
+    
+    If a profiler is given, the stages of the sweep and every batch are timed and the timings are logged when done. Batches run in the worker processes, they are recorded as ending when their results arrive.
+    """
+    # Fail before starting the worker processes.
+    check_exchange_interval(update_scheme, exchange_interval)
+    
+    if profiler is None:
+        profiler = Profiler(enabled=False)
+    
     # Generate data from simulation.
     logger.info("Generating simulation results...")
+    temperatures = np.linspace(start=0.1, stop=5.0, num=1000)
+    chunk_size = len(temperatures) if exchange_interval > 0 else SWEEP_CHUNK_SIZE
+    chunks = [temperatures[start:start + chunk_size] for start in range(0, len(temperatures), chunk_size)]
+    tasks = [(chunk, task_seed(index), update_scheme, exchange_interval) for index, chunk in enumerate(chunks)]
     mean_magnetization = {}
-    for temperature in np.linspace(start=0.1, stop=5.0, num=1000):
-        logger.info(f"Progress: {(temperature - 0.1) / (5.0 - 0.1) * 100.0:.2f}%")
-        sim = Simulation(width=20, height=20, mode="nearest_neighbour")
-        for _ in range(100):
-            sim.update(temperature)
-        mean_mag = sum(sim.average_spin_over_time[-50:]) / len(sim.average_spin_over_time[-50:]) # sim.get_average_spin()
-        mean_magnetization[temperature] = mean_mag
+    autocorrelation_times = {}
+    with profiler.phase("simulation"):
+        for results, duration in run_tasks(simulate_temperatures, tasks, workers):
+            if profiler.enabled:
+                end = time.perf_counter()
+                profiler.record("batch", end - duration, end)
+            for temperature, mean_mag, autocorrelation_time in results:
+                mean_magnetization[temperature] = mean_mag
+                autocorrelation_times[temperature] = autocorrelation_time
+            logger.info(f"Progress: {len(mean_magnetization) / len(temperatures) * 100.0:.2f}%")
     logger.info("Done generating simulation results!")
     
+    # Results arrive in order of completion, sort them by temperature again.
+    mean_magnetization = dict(sorted(mean_magnetization.items()))
+    autocorrelation_times = dict(sorted(autocorrelation_times.items()))
+    
+    # Report the slowest decorrelating temperature, averages over fewer than a few autocorrelation times are not meaningful.
+    slowest_temperature = max(autocorrelation_times, key=autocorrelation_times.get)
+    logger.info(f"Largest autocorrelation time: {autocorrelation_times[slowest_temperature]:.1f} updates (temperature {slowest_temperature:.2f}).")
+    
     # Generate data using theoretical prediction.
     logger.info("Generating theoretical predictions...")
-    theory_data = {temperature: find_tanh_x_eq_ax_solution(temperature) for temperature in np.linspace(start=0.1, stop=5.0, num=5000)}
+    with profiler.phase("theory"):
+        theory_temperatures = np.linspace(start=0.1, stop=5.0, num=5000)
+        theory_data = dict(zip(theory_temperatures, get_mean_field_magnetization(theory_temperatures)))
     logger.info("Done generating theoretical predictions!")
     
     logger.info("Generating plot...")
-    # Create figure.
-    fig, ax = plt.subplots(ncols=1, nrows=1, figsize=(12, 8))
-    
-    # Plot simulation results.
-    sim_results, = ax.plot(list(mean_magnetization.keys()), list(mean_magnetization.values()), color=PRIMARY_COLOR)
-    sim_results.set_label("Simulation Results")
-    
-    # Plot theoretical prediction.
-    theory_prediction, = ax.plot(list(theory_data.keys()), list(theory_data.values()), color=SECONDARY_COLOR)
-    theory_prediction.set_label("Theoretical Predictions")
-    
-    # Render vertical line indicating the critical temperature.
-    z = 4 # 2D
-    critical_temperature = (NEAREST_NEIGHBOUR_COUPLING_CONSTANT * z) / BOLTZMANN_CONSTANT
-    ax.vlines(x=critical_temperature, ymin=-0.1, ymax=1.1, color="black")
+    with profiler.phase("plot"):
+        # Create figure.
+        fig, ax = plt.subplots(ncols=1, nrows=1, figsize=(12, 8))
+        
+        # Plot simulation results.
+        sim_results, = ax.plot(list(mean_magnetization.keys()), list(mean_magnetization.values()), color=PRIMARY_COLOR)
+        sim_results.set_label("Simulation Results")
+        
+        # Plot theoretical prediction.
+        theory_prediction, = ax.plot(list(theory_data.keys()), list(theory_data.values()), color=SECONDARY_COLOR)
+        theory_prediction.set_label("Theoretical Predictions")
+        
+        # Render vertical line indicating the critical temperature.
+        z = 4 # 2D
+        critical_temperature = (NEAREST_NEIGHBOUR_COUPLING_CONSTANT * z) / BOLTZMANN_CONSTANT
+        ax.vlines(x=critical_temperature, ymin=-0.1, ymax=1.1, color="black")
+        
+        # Set xticks.
+        ax.set_xticks(ticks=[-1, 0, 1, 2, 3, 4, 5, critical_temperature], labels=["-1", "0", "1", "2", "3", "4", "5", r"$T_c$"])
+        
+        # Enable legend and grid.
+        ax.legend()
+        ax.grid()
+        
+        # Set graph limits.
+        ax.set_xlim([0, 5])
+        ax.set_ylim([-0.1, 1.1])
+        
+        # Set axis labels.
+        ax.set_xlabel("Temperature")
+        ax.set_ylabel("Mean Spin")
+        ax.set_title("Mean Spin vs Temperature for Mean-Field Approximation with Nearest Neighbour Interactions Only")
+        
+        # Save figure.
+        fig.tight_layout()
+        fig.savefig(output_path)
+        plt.close(fig)
     
-    # Set xticks.
-    ax.set_xticks(ticks=[-1, 0, 1, 2, 3, 4, 5, critical_temperature], labels=["-1", "0", "1", "2", "3", "4", "5", r"$T_c$"])
-    
-    # Enable legend and grid.
-    ax.legend()
-    ax.grid()
-    
-    # Set graph limits.
-    ax.set_xlim([0, 5])
-    ax.set_ylim([-0.1, 1.1])
-    
-    # Set axis labels.
-    ax.set_xlabel("Temperature")
-    ax.set_ylabel("Mean Spin")
-    ax.set_title("Mean Spin vs Temperature for Mean-Field Approximation with Nearest Neighbour Interactions Only")
-    
-    # Save figure.
-    fig.tight_layout()
-    fig.savefig("temp.png")
+    if profiler.enabled:
+        profiler.log_summary()
+
+def simulate_temperatures(temperatures, seed, update_scheme="synchronous", exchange_interval=0):
+    """
+    Simulates a 20x20 lattice at every temperature in one batch. Returns a list of the temperature, the mean spin over the last 50 updates and the autocorrelation time of the average spin, for every temperature, and the duration of the batch in seconds.
+    """
+    start = time.perf_counter()
+    np.random.seed(seed)
+    sim = ReplicaSimulation(temperatures, width=20, height=20, mode="nearest_neighbour", update_scheme=update_scheme, exchange_interval=exchange_interval)
+    for _ in range(100):
+        sim.update()
+    if exchange_interval > 0:
+        logger.info(f"Replica exchange: mean acceptance rate {np.mean(sim.get_exchange_acceptance_rates()):.2f}, minimum acceptance rate {np.min(sim.get_exchange_acceptance_rates()):.2f}, {len(sim.round_trip_times)} round trips (mean round trip time: {sim.get_mean_round_trip_time()} updates).")
+    if update_scheme in ["wolff", "swendsen_wang"] or exchange_interval > 0:
+        # Cluster updates and replica exchange flip the sign of the whole lattice freely, average the magnitude instead.
+        mean_mags = np.mean(np.abs(sim.average_spin_over_time[:, -50:]), axis=1)
+    else:
+        mean_mags = np.mean(sim.average_spin_over_time[:, -50:], axis=1)
+    return list(zip(temperatures, mean_mags, sim.get_autocorrelation_times())), time.perf_counter() - start
 
 def find_tanh_x_eq_ax_solution(temperature):
     """
-    Finds solution to the equation tanh(x) = ax.
+    Finds solution to the equation tanh(x) = ax, where x = beta J z m and a = 1 / (beta J z), and returns the (positive) mean spin m.
     """
-    # Initialize parameters for analysis.
-    z = 4 # 2D
-    beta = 1 / (BOLTZMANN_CONSTANT * temperature)
-    a = 1 / (beta * NEAREST_NEIGHBOUR_COUPLING_CONSTANT * z)
-    
-    # Check if the slope of the line a*x is greater than one. In this case there is only one solution.
-    if a > 1:
-        return 0
-    
-    # Evaluate derivative of tanh(x) - ax.
-    def eval_derivative(x):
-        return 1 - np.tanh(x) ** 2 - a
-    
-    # Evaluate tanh(x) - ax.
-    def eval_function(x):
-        return np.tanh(x) - a * x
-    
-    # Use Newton's method to find the solution.
-    x0 = 3 # Three seemed to be a good starting value regardless of a.
-    while abs(eval_function(x0)) > 0.0001:
-        x0 -= eval_function(x0) / eval_derivative(x0)
-    
-    # Return x0 * a = beta J z m * (1 / beta J z) = m.
-    return x0 * a
+    return float(solve_mean_field_magnetization([temperature])[0])
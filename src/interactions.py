@@ -0,0 +1,257 @@
+from loguru import logger
+import numpy as np
+
+# Largest number of colours tried when looking for a colouring of a stencil.
+MAXIMUM_STENCIL_COLORS = 16
+
+class StencilInteraction:
+    """
+    Translation invariant couplings within a small neighbourhood, given as a stencil: stencil[dy + ry, dx + rx] is the coupling J between a spin and the spin dx to the right and dy below it, where (2ry + 1, 2rx + 1) is the (odd) shape of the stencil. The stencil must be symmetric, and its centre (the coupling of a spin with itself) zero.
+    
+    Local fields are a convolution of the lattice with the stencil, computed with one vectorized shifted add per coupling. Neighbours outside of the lattice do not exist (open boundaries). Works on any lattice size.
+    """
+    
+    def __init__(self, stencil):
+        self.stencil = np.asarray(stencil, dtype=np.float64)
+        if self.stencil.ndim != 2 or self.stencil.shape[0] % 2 == 0 or self.stencil.shape[1] % 2 == 0:
+            raise ValueError(f"Stencil must be a 2D array of odd shape, got shape {self.stencil.shape}.")
+        if not np.array_equal(self.stencil, self.stencil[::-1, ::-1]):
+            raise ValueError("Stencil must be symmetric, the coupling of i to j is the coupling of j to i.")
+        
+        radius_y, radius_x = self.stencil.shape[0] // 2, self.stencil.shape[1] // 2
+        if self.stencil[radius_y, radius_x] != 0:
+            raise ValueError("The centre of the stencil (the coupling of a spin with itself) must be zero.")
+        
+        # Offsets and couplings of the non-zero entries.
+        self.offsets = [(dy - radius_y, dx - radius_x) for dy, dx in zip(*np.nonzero(self.stencil))]
+        self.couplings = [self.stencil[dy + radius_y, dx + radius_x] for dy, dx in self.offsets]
+        self.shape = None
+    
+    def local_field(self, spins):
+        """
+        Returns the local field h_i = sum(J_ij * S_j) of every spin in the lattice (or in every lattice of a stack of lattices).
+        """
+        height, width = spins.shape[-2:]
+        local_field = np.zeros(spins.shape, dtype=np.float64)
+        for (dy, dx), coupling in zip(self.offsets, self.couplings):
+            if abs(dy) >= height or abs(dx) >= width:
+                continue
+            # The spin at (y, x) sees the spin at (y + dy, x + dx).
+            target = (..., slice(max(0, -dy), height - max(0, dy)), slice(max(0, -dx), width - max(0, dx)))
+            source = (..., slice(max(0, dy), height + min(0, dy)), slice(max(0, dx), width + min(0, dx)))
+            local_field[target] += coupling * spins[source]
+        return local_field
+    
+    def get_coloring(self, width, height):
+        """
+        Returns boolean masks of the colours of a colouring in which spins of the same colour do not interact, so a whole colour can be updated at once. The colour of (x, y) is (a * x + b * y) % colors, for the fewest colors that work. Returns None if there is no such colouring with at most MAXIMUM_STENCIL_COLORS colours.
+        """
+        y, x = np.indices((height, width))
+        for colors in range(2, MAXIMUM_STENCIL_COLORS + 1):
+            for a in range(colors):
+                for b in range(colors):
+                    if all((a * dx + b * dy) % colors != 0 for dy, dx in self.offsets):
+                        color = (a * x + b * y) % colors
+                        return [color == index for index in range(colors)]
+        return None
+    
+    def get_couplings(self, x, y, width, height):
+        """
+        Returns the couplings J_ij of the spin at (x, y) with every spin of a width x height lattice, as a (height, width) array.
+        """
+        couplings = np.zeros((height, width), dtype=np.float64)
+        for (dy, dx), coupling in zip(self.offsets, self.couplings):
+            if 0 <= y + dy < height and 0 <= x + dx < width:
+                couplings[y + dy, x + dx] = coupling
+        return couplings
+
+class SparseInteraction:
+    """
+    Couplings of an arbitrary graph, given as a symmetric sparse coupling matrix in CSR form (indptr, indices, data, as in scipy.sparse.csr_matrix) over the flattened lattice, where spin (x, y) has index y * width + x. Row i holds the couplings J_ij of spin i, the diagonal must be empty.
+    
+    Only works on the lattice size it was made for.
+    """
+    
+    def __init__(self, width, height, indptr, indices, data):
+        self.shape = (height, width)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.data = np.asarray(data, dtype=np.float64)
+        if len(self.indptr) != width * height + 1:
+            raise ValueError(f"Coupling matrix has {len(self.indptr) - 1} rows, the {width}x{height} lattice has {width * height} spins.")
+        
+        # Row of every stored coupling, for the matrix-vector product.
+        self.rows = np.repeat(np.arange(width * height), np.diff(self.indptr))
+        if np.any(self.rows == self.indices):
+            raise ValueError("Coupling matrix has a non-zero diagonal, spins cannot couple to themselves.")
+    
+    @classmethod
+    def from_matrix(cls, width, height, matrix):
+        """
+        Creates the interaction from a scipy.sparse matrix (or anything with CSR indptr, indices and data).
+        """
+        matrix = matrix.tocsr() if hasattr(matrix, "tocsr") else matrix
+        return cls(width, height, matrix.indptr, matrix.indices, matrix.data)
+    
+    @classmethod
+    def from_edges(cls, width, height, edges, couplings):
+        """
+        Creates the interaction from a list of edges (i, j) between flat spin indices and the coupling of every edge. Every edge couples both ways.
+        """
+        edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+        couplings = np.broadcast_to(np.asarray(couplings, dtype=np.float64), (len(edges),))
+        rows = np.concatenate([edges[:, 0], edges[:, 1]])
+        columns = np.concatenate([edges[:, 1], edges[:, 0]])
+        data = np.concatenate([couplings, couplings])
+        
+        # Sort by row, then by column, to get CSR order.
+        order = np.lexsort((columns, rows))
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=width * height))])
+        return cls(width, height, indptr, columns[order], data[order])
+    
+    def local_field(self, spins):
+        """
+        Returns the local field h_i = sum(J_ij * S_j) of every spin in the lattice (or in every lattice of a stack of lattices), as a sparse matrix-vector product.
+        """
+        sites = self.shape[0] * self.shape[1]
+        flat_spins = spins.reshape(-1, sites)
+        stack = len(flat_spins)
+        
+        # Sum the products of every row, offsetting the rows of every lattice in the stack so a single bincount does all of them.
+        products = flat_spins[:, self.indices] * self.data
+        rows = (self.rows + sites * np.arange(stack)[:, None]).ravel()
+        return np.bincount(rows, weights=products.ravel(), minlength=stack * sites).reshape(spins.shape)
+    
+    def get_coloring(self, width, height):
+        """
+        Returns boolean masks of the colours of a greedy colouring of the graph (largest degree first), in which spins of the same colour do not interact.
+        """
+        sites = width * height
+        colors = np.full(sites, -1)
+        for site in np.argsort(-np.diff(self.indptr), kind="stable"):
+            neighbour_colors = set(colors[self.indices[self.indptr[site]:self.indptr[site + 1]]].tolist())
+            color = 0
+            while color in neighbour_colors:
+                color += 1
+            colors[site] = color
+        colors = colors.reshape(height, width)
+        return [colors == color for color in range(colors.max() + 1)]
+    
+    def get_couplings(self, x, y, width, height):
+        """
+        Returns the couplings J_ij of the spin at (x, y) with every spin of the lattice, as a (height, width) array.
+        """
+        site = y * width + x
+        couplings = np.zeros(width * height, dtype=np.float64)
+        couplings[self.indices[self.indptr[site]:self.indptr[site + 1]]] = self.data[self.indptr[site]:self.indptr[site + 1]]
+        return couplings.reshape(height, width)
+
+class FFTInteraction:
+    """
+    Translation invariant long-range couplings, e.g. all-to-all or 1/r^alpha couplings, given as a kernel: kernel[dy + height - 1, dx + width - 1] is the coupling J between a spin and the spin dx to the right and dy below it, for every offset within the lattice. The kernel must be symmetric, and its centre zero.
+    
+    Local fields are a convolution of the lattice with the kernel, computed with FFTs of the zero-padded lattice in O(N log N) instead of O(N^2). Neighbours outside of the lattice do not exist (open boundaries). Every spin interacts with every other spin, so there is no colouring, the checkerboard schemes update the spins one at a time (see Simulation.update_sequential()).
+    
+    Only works on the lattice size it was made for.
+    """
+    
+    def __init__(self, width, height, kernel):
+        self.shape = (height, width)
+        kernel = np.asarray(kernel, dtype=np.float64)
+        if kernel.shape != (2 * height - 1, 2 * width - 1):
+            raise ValueError(f"Kernel of a {width}x{height} lattice must have shape {(2 * height - 1, 2 * width - 1)}, got shape {kernel.shape}.")
+        if not np.array_equal(kernel, kernel[::-1, ::-1]):
+            raise ValueError("Kernel must be symmetric, the coupling of i to j is the coupling of j to i.")
+        if kernel[height - 1, width - 1] != 0:
+            raise ValueError("The centre of the kernel (the coupling of a spin with itself) must be zero.")
+        self.kernel = kernel
+        
+        # Transform of the kernel, padded so the circular convolution of the FFT equals the linear convolution on the lattice, and further to sizes the FFT is fast for.
+        self.fft_shape = (fast_fft_length(2 * height - 1), fast_fft_length(2 * width - 1))
+        self.kernel_fft = np.fft.rfft2(kernel, s=self.fft_shape)
+    
+    @classmethod
+    def from_distance(cls, width, height, coupling):
+        """
+        Creates the interaction from a function of the distance r between two spins, coupling(r) for every r > 0 (as an array).
+        """
+        dy, dx = np.indices((2 * height - 1, 2 * width - 1))
+        distance = np.hypot(dy - (height - 1), dx - (width - 1))
+        kernel = np.zeros(distance.shape)
+        kernel[distance > 0] = coupling(distance[distance > 0])
+        return cls(width, height, kernel)
+    
+    def local_field(self, spins):
+        """
+        Returns the local field h_i = sum(J_ij * S_j) of every spin in the lattice (or in every lattice of a stack of lattices).
+        """
+        height, width = self.shape
+        convolution = np.fft.irfft2(np.fft.rfft2(spins, s=self.fft_shape) * self.kernel_fft, s=self.fft_shape)
+        return convolution[..., height - 1:2 * height - 1, width - 1:2 * width - 1]
+    
+    def get_coloring(self, width, height):
+        return None
+    
+    def get_couplings(self, x, y, width, height):
+        """
+        Returns the couplings J_ij of the spin at (x, y) with every spin of the lattice, as a (height, width) view of the kernel.
+        """
+        return self.kernel[height - 1 - y:2 * height - 1 - y, width - 1 - x:2 * width - 1 - x]
+
+def fast_fft_length(length):
+    """
+    Returns the smallest length of at least length without prime factors other than 2, 3 and 5, for which FFTs are fastest.
+    """
+    while True:
+        remainder = length
+        for factor in [2, 3, 5]:
+            while remainder % factor == 0:
+                remainder //= factor
+        if remainder == 1:
+            return length
+        length += 1
+
+def nearest_neighbour_interaction(coupling_constant):
+    """
+    Returns the nearest neighbour couplings as an interaction, the equivalent of the 'nearest_neighbour' mode.
+    """
+    return StencilInteraction([[0, coupling_constant, 0], [coupling_constant, 0, coupling_constant], [0, coupling_constant, 0]])
+
+def next_nearest_neighbour_interaction(coupling_constant, next_nearest_coupling_constant):
+    """
+    Returns couplings with the four nearest neighbours and the four diagonal (next-nearest) neighbours.
+    """
+    J1, J2 = coupling_constant, next_nearest_coupling_constant
+    return StencilInteraction([[J2, J1, J2], [J1, 0, J1], [J2, J1, J2]])
+
+def all_to_all_interaction(width, height, coupling_constant):
+    """
+    Returns couplings of every spin with every other spin, J_ij = J / N so the energy stays proportional to the number of spins N.
+    """
+    sites = width * height
+    return FFTInteraction.from_distance(width, height, lambda distance: np.full(distance.shape, coupling_constant / sites))
+
+def power_law_interaction(width, height, coupling_constant, exponent):
+    """
+    Returns couplings decaying with the distance r between two spins, J_ij = J / r^exponent.
+    """
+    return FFTInteraction.from_distance(width, height, lambda distance: coupling_constant / distance ** exponent)
+
+# Interactions that can be created by name, see create_interaction(). The long-range ones couple every spin to every other spin, they have no colouring and their spins are updated one at a time.
+INTERACTIONS = ["nearest_neighbour", "next_nearest_neighbour", "all_to_all", "power_law"]
+LONG_RANGE_INTERACTIONS = ["all_to_all", "power_law"]
+
+def create_interaction(name, width, height, coupling_constant, next_nearest_coupling_constant=0.0, exponent=3.0):
+    """
+    Returns the interaction with this name for a width x height lattice, next_nearest_coupling_constant applies to 'next_nearest_neighbour' and exponent to 'power_law'.
+    """
+    if name == "nearest_neighbour":
+        return nearest_neighbour_interaction(coupling_constant)
+    if name == "next_nearest_neighbour":
+        return next_nearest_neighbour_interaction(coupling_constant, next_nearest_coupling_constant)
+    if name == "all_to_all":
+        return all_to_all_interaction(width, height, coupling_constant)
+    if name == "power_law":
+        return power_law_interaction(width, height, coupling_constant, exponent)
+    logger.critical(f"Interaction '{name}' is not a valid interaction! (Options: {INTERACTIONS})")
+    return None
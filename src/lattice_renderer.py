@@ -0,0 +1,193 @@
+from functools import lru_cache
+
+import numpy as np
+import pygame
+
+# Distance between neighbouring spins on screen at zoom 1, in pixels.
+SPIN_SEPARATION = 50
+
+# Colors of spin down, 'no spin' and spin up, indexed by spin + 1.
+RECTANGLE_PALETTE = np.array([(255, 0, 0), (0, 0, 255), (0, 255, 0)], dtype=np.uint8)
+ARROW_COLOR = (255, 255, 255)
+NO_SPIN_COLOR = (0, 0, 255)
+
+# Below this spin size (in pixels) arrows are unreadable, render average spins instead.
+MINIMUM_ARROW_SIZE = 6
+
+# From this spin size (in pixels) arrows are blitted one by one from a pre-rendered tile, smaller arrows are faster assembled into a single image. Above LARGE_ARROW_SIZE they are drawn one by one, few are visible and their tiles would be large. Both measured on a 1920x1080 display.
+ARROW_BLIT_SIZE = 8
+LARGE_ARROW_SIZE = 64
+
+def render_lattice(display, spins, resolution, zoom, render_mode):
+    """
+    Renders the lattice centered on the display. Only the spins within the display are rendered, rectangles as a single image of the display, arrows as a single image, blitted tiles or drawn one by one depending on their size. When zoomed out so far that spins (or arrows) become too small to see, blocks of spins are rendered as their average spin instead.
+    """
+    height, width = spins.shape
+    spin_size = SPIN_SEPARATION * zoom
+    
+    # Screen position of spin (0, 0), the lattice is centered on the screen.
+    origin = (resolution[0] / 2 - width / 2 * spin_size, resolution[1] / 2 - height / 2 * spin_size)
+    
+    # Level of detail, render blocks of block_size x block_size spins as one rectangle if spins are too small.
+    level_of_detail = spin_size < 1 or (render_mode == "arrow" and spin_size < MINIMUM_ARROW_SIZE)
+    block_size = max(1, int(np.ceil(1 / spin_size))) if level_of_detail else 1
+    
+    # Find the visible spins, with a margin of one spin for the arrows which stick out by half a spin. Align the window to whole blocks, so blocks do not change while zooming or panning.
+    x_start, x_end = visible_range(origin[0], spin_size, resolution[0], width, block_size)
+    y_start, y_end = visible_range(origin[1], spin_size, resolution[1], height, block_size)
+    if x_start >= x_end or y_start >= y_end:
+        return
+    visible_spins = spins[y_start:y_end, x_start:x_end]
+    visible_origin = (origin[0] + x_start * spin_size, origin[1] + y_start * spin_size)
+    
+    if level_of_detail:
+        render_average_spins(display, block_average(visible_spins, block_size), visible_origin, block_size * spin_size)
+    elif render_mode == "arrow" and spin_size > LARGE_ARROW_SIZE:
+        draw_arrows(display, visible_spins, visible_origin, spin_size)
+    elif render_mode == "arrow" and spin_size >= ARROW_BLIT_SIZE:
+        blit_arrows(display, visible_spins, visible_origin, spin_size)
+    elif render_mode == "arrow":
+        render_arrows(display, visible_spins, visible_origin, spin_size)
+    elif render_mode == "rectangle":
+        render_rectangles(display, visible_spins, visible_origin, spin_size)
+
+def visible_range(origin, spin_size, screen_size, lattice_size, block_size=1):
+    """
+    Returns the start and end index of the spins that are (partially) visible along one axis, extended by one spin and aligned to multiples of block_size.
+    """
+    start = int(np.floor(-origin / spin_size)) - 1
+    end = int(np.ceil((screen_size - origin) / spin_size)) + 1
+    start = max(0, (start // block_size) * block_size)
+    end = min(lattice_size, -(-end // block_size) * block_size)
+    return start, end
+
+def block_average(spins, block_size):
+    """
+    Returns the average spin of every block_size x block_size block of spins. Blocks at the edges may be cut off by the lattice boundary, those are averaged over the spins they do contain.
+    """
+    if block_size == 1:
+        return spins.astype(np.float32)
+    
+    # Pad the lattice to whole blocks, padding spins count as zero and are not counted.
+    height, width = spins.shape
+    blocks_y, blocks_x = -(-height // block_size), -(-width // block_size)
+    padded = np.zeros((blocks_y * block_size, blocks_x * block_size), dtype=np.int32)
+    padded[:height, :width] = spins
+    block_sums = padded.reshape(blocks_y, block_size, blocks_x, block_size).sum(axis=(1, 3))
+    
+    # Count the spins in every block.
+    counts_y = np.minimum(block_size, height - np.arange(blocks_y) * block_size)
+    counts_x = np.minimum(block_size, width - np.arange(blocks_x) * block_size)
+    return (block_sums / np.outer(counts_y, counts_x)).astype(np.float32)
+
+def render_average_spins(display, average_spins, origin, block_size):
+    """
+    Renders every average spin as a rectangle, blending from the spin down color (-1) to the spin up color (+1).
+    """
+    height, width = average_spins.shape
+    spin_up_fraction = ((average_spins + 1) / 2)[..., None]
+    pixels = ((1 - spin_up_fraction) * RECTANGLE_PALETTE[0] + spin_up_fraction * RECTANGLE_PALETTE[2]).astype(np.uint8)
+    
+    # Surfarray images are indexed (x, y), transpose the (y, x) blocks.
+    surface = pygame.surfarray.make_surface(pixels.swapaxes(0, 1))
+    surface = pygame.transform.scale(surface, (max(1, round(width * block_size)), max(1, round(height * block_size))))
+    display.blit(surface, origin)
+
+def render_rectangles(display, spins, origin, spin_size):
+    """
+    Renders every spin as a colored rectangle with its top left corner at its position. Builds an 8 bit image of the part of the lattice on the display, every spin repeated over its pixels, and blits it with the palette, so its size does not grow with the zoom.
+    """
+    height, width = spins.shape
+    display_width, display_height = display.get_size()
+    
+    # Pixel edges of the columns and rows of spins, clipped to the display. Round the edges rather than the sizes, so neighbouring rectangles leave no gaps.
+    x_edges = np.clip(np.round(origin[0] + np.arange(width + 1) * spin_size), 0, display_width).astype(np.intp)
+    y_edges = np.clip(np.round(origin[1] + np.arange(height + 1) * spin_size), 0, display_height).astype(np.intp)
+    
+    # Surfarray images are indexed (x, y), transpose the (y, x) image of palette indices. The transpose keeps the rows of the image contiguous, as in the surface.
+    indices = np.repeat(np.repeat((spins + 1).astype(np.uint8), np.diff(y_edges), axis=0), np.diff(x_edges), axis=1)
+    if indices.size == 0:
+        return
+    surface = pygame.surfarray.make_surface(indices.T)
+    surface.set_palette(RECTANGLE_PALETTE.tolist())
+    display.blit(surface, (int(x_edges[0]), int(y_edges[0])))
+
+def render_arrows(display, spins, origin, spin_size):
+    """
+    Renders every spin as an arrow centered on its position. The image is assembled from pre-rendered arrow tiles and scaled to the exact spin size once. Only used below ARROW_BLIT_SIZE, so the image stays about as large as the display and the tiles stay small.
+    """
+    height, width = spins.shape
+    tile_size = max(1, round(spin_size))
+    atlas = get_arrow_atlas(tile_size)
+    
+    # Look up a tile for every spin, (x, y, tile x, tile y, color), and interleave the tiles into a single (x, y, color) image.
+    tiles = atlas[spins.T + 1]
+    pixels = tiles.transpose(0, 2, 1, 3, 4).reshape(width * tile_size, height * tile_size, 3)
+    surface = pygame.surfarray.make_surface(pixels)
+    if tile_size != spin_size:
+        surface = pygame.transform.scale(surface, (max(1, round(width * spin_size)), max(1, round(height * spin_size))))
+    surface.set_colorkey((0, 0, 0))
+    
+    # Arrows are centered on the spin positions, shift by half a spin.
+    display.blit(surface, (origin[0] - spin_size / 2, origin[1] - spin_size / 2))
+
+def blit_arrows(display, spins, origin, spin_size):
+    """
+    Renders every spin as an arrow centered on its position, blitting a pre-rendered tile of the rounded spin size for every spin in a single call.
+    """
+    height, width = spins.shape
+    tile_size = max(1, round(spin_size))
+    tiles = get_arrow_tiles(tile_size)
+    
+    # Top left corners of the tiles, centered on the spin positions. Floor the positions like pygame.draw does, so the tiles land where draw_arrows() would draw.
+    lefts = (np.floor(origin[0] + np.arange(width) * spin_size).astype(int) - tile_size // 2).tolist()
+    tops = (np.floor(origin[1] + np.arange(height) * spin_size).astype(int) - tile_size // 2).tolist()
+    display.blits([(tiles[spin + 1], (left, top)) for top, row in zip(tops, spins.tolist()) for left, spin in zip(lefts, row)], doreturn=False)
+
+def draw_arrows(display, spins, origin, spin_size):
+    """
+    Draws every spin as an arrow centered on its position, directly on the display. Nothing larger than the display is allocated, the drawing is clipped to the display.
+    """
+    for y, row in enumerate(spins.tolist()):
+        for x, spin in enumerate(row):
+            draw_arrow(display, spin, (origin[0] + x * spin_size, origin[1] + y * spin_size), spin_size)
+
+def draw_arrow(surface, spin, center, spin_size):
+    """
+    Draws the arrow of a spin (a circle for 'no spin') centered on center. The arrows have the same proportions at every spin size, half an arrow is a fifth of the spin separation.
+    """
+    center_x, center_y = center
+    half_line_length = spin_size / 5
+    if spin == 0:
+        pygame.draw.circle(surface, NO_SPIN_COLOR, center, half_line_length)
+        return
+    
+    # Arrow head at the top for spin up, at the bottom for spin down.
+    tip_y = center_y - spin * half_line_length
+    pygame.draw.line(surface, ARROW_COLOR, (center_x, center_y - half_line_length), (center_x, center_y + half_line_length))
+    pygame.draw.line(surface, ARROW_COLOR, (center_x, tip_y), (center_x - half_line_length * 0.4, tip_y + spin * half_line_length * 0.4))
+    pygame.draw.line(surface, ARROW_COLOR, (center_x, tip_y), (center_x + half_line_length * 0.4, tip_y + spin * half_line_length * 0.4))
+
+@lru_cache(maxsize=LARGE_ARROW_SIZE)
+def get_arrow_tiles(tile_size):
+    """
+    Returns the spin down, 'no spin' and spin up tiles (indexed by spin + 1) as surfaces with a transparent background, see draw_arrow(). Tiles are at most LARGE_ARROW_SIZE pixels, so the tiles of every size the zoom passes through fit in the cache together (about 1 MB).
+    """
+    tiles = []
+    for spin in [-1, 0, +1]:
+        tile = pygame.Surface((tile_size, tile_size))
+        draw_arrow(tile, spin, (tile_size / 2, tile_size / 2), tile_size)
+        tile.set_colorkey((0, 0, 0))
+        tiles.append(tile)
+    return tiles
+
+@lru_cache(maxsize=ARROW_BLIT_SIZE)
+def get_arrow_atlas(tile_size):
+    """
+    Returns the arrow tiles of get_arrow_tiles() as a (3, tile size, tile size, 3) surfarray pixel array.
+    """
+    atlas = np.stack([pygame.surfarray.array3d(tile) for tile in get_arrow_tiles(tile_size)])
+    
+    # Cached atlases are shared, make sure nobody modifies them.
+    atlas.flags.writeable = False
+    return atlas
@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import tempfile
+
+from loguru import logger
+import numpy as np
+
+from src.constants import *
+
+# Directory in which solved mean-field curves are cached.
+MEAN_FIELD_CACHE_DIRECTORY = os.path.join(".cache", "mean_field")
+
+# Solve every CONTINUATION_STRIDE-th temperature first, and start the others from the interpolated solutions.
+CONTINUATION_STRIDE = 16
+
+# Halvings of the bracket in the bisection fallback, enough to shrink it from width 1 below the resolution of a double.
+BISECTION_ITERATIONS = 64
+
+def solve_mean_field_magnetization(temperatures, coupling_constant=NEAREST_NEIGHBOUR_COUPLING_CONSTANT, boltzmann_constant=BOLTZMANN_CONSTANT, coordination_number=4, external_field=0.0, tolerance=1e-10, max_iterations=100, initial_guess=None):
+    """
+    Solves the mean-field equation m = tanh(beta * (J * z * m + H)) for every temperature at once, using Newton's method. Temperatures where Newton's method does not converge (it oscillates for J < 0 in a field) are solved by bisection.
+    
+    Without an initial guess, every temperature starts at m = sign(H) (or m = 1 without field), which converges to the solution aligned with the field (the positive solution without field). Initial guesses from which Newton's method could run off to another solution are replaced by this starting value.
+    """
+    temperatures = np.asarray(temperatures, dtype=np.float64)
+    beta = 1 / (boltzmann_constant * temperatures)
+    slope = beta * coupling_constant * coordination_number
+    offset = beta * external_field
+    start = np.sign(external_field) if external_field != 0 else 1.0
+    
+    def derivative(m, slope, offset):
+        return 1 - slope * (1 - np.tanh(slope * m + offset) ** 2)
+    
+    # Start from the initial guess where the derivative is positive, Newton's method moves away from the solution elsewhere.
+    if initial_guess is None:
+        m = np.full(temperatures.shape, start)
+    else:
+        m = np.asarray(initial_guess, dtype=np.float64).copy()
+        m[~(derivative(m, slope, offset) > 0)] = start
+    
+    # Without field, m = 0 is the only solution if beta J z <= 1.
+    disordered = (external_field == 0) & (slope <= 1)
+    m[disordered] = 0
+    
+    # Newton iterations, only on temperatures that have not converged yet.
+    active = ~disordered
+    for _ in range(max_iterations):
+        residual = m[active] - np.tanh(slope[active] * m[active] + offset[active])
+        converged = np.abs(residual) <= tolerance
+        indices = np.flatnonzero(active)
+        active[indices[converged]] = False
+        if not active.any():
+            break
+        m[active] = np.clip(m[active] - residual[~converged] / derivative(m[active], slope[active], offset[active]), -1, 1)
+    
+    # Bisect the rest. The residual m - tanh(slope * m + offset) is at most 0 at m = 0 and at least 0 at m = start (the other way around for start = -1), so the bracket between them holds the solution aligned with the field, the only one for J < 0.
+    if active.any():
+        lower = np.full(np.count_nonzero(active), min(start, 0.0))
+        upper = np.full(np.count_nonzero(active), max(start, 0.0))
+        for _ in range(BISECTION_ITERATIONS):
+            middle = (lower + upper) / 2
+            below = middle - np.tanh(slope[active] * middle + offset[active]) <= 0
+            lower = np.where(below, middle, lower)
+            upper = np.where(below, upper, middle)
+        m[active] = (lower + upper) / 2
+        
+        residual = np.abs(m - np.tanh(slope * m + offset))
+        if np.any(residual[active] > tolerance):
+            logger.warning(f"Mean-field solution did not converge for {np.count_nonzero(residual[active] > tolerance)} temperature(s).")
+    return m
+
+def solve_mean_field_magnetization_continuation(temperatures, **kwargs):
+    """
+    Solves the mean-field equation on a coarse subset of the temperatures first, then starts every temperature from the solution interpolated from its coarse neighbours. Takes the same keyword arguments as solve_mean_field_magnetization().
+    """
+    temperatures = np.asarray(temperatures, dtype=np.float64)
+    if len(temperatures) < 2 * CONTINUATION_STRIDE:
+        return solve_mean_field_magnetization(temperatures, **kwargs)
+    
+    order = np.argsort(temperatures)
+    coarse_temperatures = temperatures[order][::CONTINUATION_STRIDE]
+    coarse_solution = solve_mean_field_magnetization(coarse_temperatures, **kwargs)
+    initial_guess = np.interp(temperatures, coarse_temperatures, coarse_solution)
+    return solve_mean_field_magnetization(temperatures, initial_guess=initial_guess, **kwargs)
+
+def get_mean_field_magnetization(temperatures, coupling_constant=NEAREST_NEIGHBOUR_COUPLING_CONSTANT, boltzmann_constant=BOLTZMANN_CONSTANT, coordination_number=4, external_field=0.0, cache_directory=MEAN_FIELD_CACHE_DIRECTORY):
+    """
+    Returns the mean-field magnetization for every temperature, loaded from the cache on disk if this curve (constants and temperature grid) has been solved before.
+    """
+    temperatures = np.asarray(temperatures, dtype=np.float64)
+    parameters = {"coupling_constant": coupling_constant, "boltzmann_constant": boltzmann_constant, "coordination_number": coordination_number, "external_field": external_field}
+    
+    # Key the cache on the parameters and the exact temperature grid.
+    key = hashlib.sha256(json.dumps(parameters, sort_keys=True).encode("utf-8") + temperatures.tobytes()).hexdigest()
+    cache_path = os.path.join(cache_directory, f"{key}.npy")
+    if os.path.exists(cache_path):
+        try:
+            magnetization = np.load(cache_path)
+            logger.debug(f"Loaded mean-field solution from '{cache_path}'.")
+            return magnetization
+        except (OSError, ValueError, EOFError) as error:
+            logger.warning(f"Ignoring unreadable mean-field cache '{cache_path}': {error}")
+    
+    # Solve and store, to a temporary file in the same directory first and then renamed, so an interrupted write never leaves a partial cache file behind.
+    magnetization = solve_mean_field_magnetization_continuation(temperatures, **parameters)
+    os.makedirs(cache_directory, exist_ok=True)
+    file_descriptor, temporary_path = tempfile.mkstemp(dir=cache_directory, prefix=".mean-field-")
+    try:
+        with os.fdopen(file_descriptor, "wb") as file:
+            np.save(file, magnetization)
+        os.replace(temporary_path, cache_path)
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+    return magnetization
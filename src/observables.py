@@ -0,0 +1,144 @@
+import numpy as np
+
+class RingBuffer:
+    """
+    Fixed capacity history of values. Once full, appending a value overwrites the oldest value, so memory use is bounded regardless of how many values are appended.
+    """
+    
+    def __init__(self, capacity, dtype=np.float64):
+        self.capacity = capacity
+        self.data = np.zeros(capacity, dtype=dtype)
+        self.count = 0 # Total number of values ever appended.
+    
+    def append(self, value):
+        self.data[self.count % self.capacity] = value
+        self.count += 1
+    
+    def values(self):
+        """
+        Returns the stored values, oldest first.
+        """
+        if self.count <= self.capacity:
+            return self.data[:self.count].copy()
+        start = self.count % self.capacity
+        return np.concatenate([self.data[start:], self.data[:start]])
+    
+    def times(self):
+        """
+        Returns the index (e.g. the update number) of every stored value, oldest first.
+        """
+        return np.arange(self.count - len(self), self.count)
+    
+    def __len__(self):
+        return min(self.count, self.capacity)
+    
+    def __getitem__(self, key):
+        return self.values()[key]
+    
+    def __iter__(self):
+        return iter(self.values())
+
+class RunningStatistics:
+    """
+    Online mean and variance of a stream of values (Welford's algorithm), in O(1) memory.
+    """
+    
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.sum_of_squared_deviations = 0.0
+    
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.sum_of_squared_deviations += delta * (value - self.mean)
+    
+    def get_mean(self):
+        return self.mean
+    
+    def get_variance(self):
+        if self.count < 2:
+            return 0.0
+        return self.sum_of_squared_deviations / self.count
+
+class Observables:
+    """
+    Keeps a bounded history of the average spin and running statistics of the magnetization (per spin) and the total energy, from which the susceptibility, specific heat and Binder cumulant follow in O(1) memory.
+    """
+    
+    def __init__(self, sites, history_capacity=10000):
+        self.sites = sites
+        self.average_spin_history = RingBuffer(history_capacity)
+        self.reset()
+    
+    def reset(self):
+        """
+        Resets the running statistics, the history is kept.
+        """
+        self.magnetization = RunningStatistics()
+        self.absolute_magnetization = RunningStatistics()
+        self.magnetization_squared = RunningStatistics()
+        self.magnetization_fourth = RunningStatistics()
+        self.energy = RunningStatistics()
+    
+    def get_running_statistics(self):
+        """
+        Returns the running statistics by name.
+        """
+        return {
+            "magnetization": self.magnetization,
+            "absolute_magnetization": self.absolute_magnetization,
+            "magnetization_squared": self.magnetization_squared,
+            "magnetization_fourth": self.magnetization_fourth,
+            "energy": self.energy,
+        }
+    
+    def add(self, magnetization, energy):
+        self.average_spin_history.append(magnetization)
+        self.magnetization.add(magnetization)
+        self.absolute_magnetization.add(abs(magnetization))
+        self.magnetization_squared.add(magnetization ** 2)
+        self.magnetization_fourth.add(magnetization ** 4)
+        self.energy.add(energy)
+    
+    def get_susceptibility(self, temperature, boltzmann_constant):
+        """
+        Returns the magnetic susceptibility per spin, N / kT * (<m^2> - <|m|>^2). The magnitude is used as a finite lattice spends time in both the positive and the negative state.
+        """
+        return self.sites / (boltzmann_constant * temperature) * (self.magnetization_squared.get_mean() - self.absolute_magnetization.get_mean() ** 2)
+    
+    def get_specific_heat(self, temperature, boltzmann_constant):
+        """
+        Returns the specific heat per spin, (<E^2> - <E>^2) / (N k T^2).
+        """
+        return self.energy.get_variance() / (self.sites * boltzmann_constant * temperature ** 2)
+    
+    def get_binder_cumulant(self):
+        """
+        Returns the Binder cumulant 1 - <m^4> / (3 <m^2>^2), which goes to 2/3 in the ordered phase and to 0 in the disordered phase.
+        """
+        if self.magnetization_squared.get_mean() == 0:
+            return 0.0
+        return 1 - self.magnetization_fourth.get_mean() / (3 * self.magnetization_squared.get_mean() ** 2)
+
+def series_statistics(average_spins, energies, sites, temperatures, boltzmann_constant):
+    """
+    Returns the observables of Observables for every row of a (replicas, updates) history of average spins and total energies at the given temperatures, as arrays by name. The energy is returned per spin.
+    """
+    average_spins = np.asarray(average_spins, dtype=np.float64)
+    energies = np.asarray(energies, dtype=np.float64)
+    temperatures = np.asarray(temperatures, dtype=np.float64)
+    
+    magnetization_squared = np.mean(average_spins ** 2, axis=-1)
+    absolute_magnetization = np.mean(np.abs(average_spins), axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        binder_cumulant = np.where(magnetization_squared == 0, 0.0, 1 - np.mean(average_spins ** 4, axis=-1) / (3 * magnetization_squared ** 2))
+    return {
+        "mean_magnetization": np.mean(average_spins, axis=-1),
+        "mean_absolute_magnetization": absolute_magnetization,
+        "mean_energy": np.mean(energies, axis=-1) / sites,
+        "susceptibility": sites / (boltzmann_constant * temperatures) * (magnetization_squared - absolute_magnetization ** 2),
+        "specific_heat": np.var(energies, axis=-1) / (sites * boltzmann_constant * temperatures ** 2),
+        "binder_cumulant": binder_cumulant,
+    }
@@ -0,0 +1,120 @@
+from collections import deque
+from contextlib import nullcontext
+import json
+import os
+import threading
+import time
+
+from loguru import logger
+import numpy as np
+
+from src.observables import RingBuffer
+
+# Number of most recent durations per phase the percentiles are computed from.
+PHASE_HISTORY_SIZE = 1024
+
+# Number of most recent phases kept for the Chrome trace.
+TRACE_CAPACITY = 100000
+
+PERCENTILES = [50, 95, 99]
+
+# Returned by Profiler.phase() while disabled, entering and exiting it does nothing.
+NULL_PHASE = nullcontext()
+
+class Profiler:
+    """
+    Opt-in timer of named phases, e.g. the stages of the visualizer main loop. Time a phase with
+    
+        with profiler.phase("update"):
+            ...
+    
+    The latest PHASE_HISTORY_SIZE durations of every phase are kept for percentiles, and the latest TRACE_CAPACITY phases for a Chrome trace (chrome://tracing or https://ui.perfetto.dev). While disabled, phase() returns a shared no-op context manager and nothing is recorded.
+    """
+    
+    def __init__(self, enabled=False, history_size=PHASE_HISTORY_SIZE, trace_capacity=TRACE_CAPACITY):
+        self.enabled = enabled
+        self.history_size = history_size
+        self.origin = time.perf_counter()
+        
+        # Phases may be timed on several threads (e.g. the simulation worker).
+        self.lock = threading.Lock()
+        self.durations = {}
+        self.trace_events = deque(maxlen=trace_capacity)
+    
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+    
+    def reset(self):
+        with self.lock:
+            self.durations = {}
+            self.trace_events.clear()
+    
+    def phase(self, name):
+        if not self.enabled:
+            return NULL_PHASE
+        return Phase(self, name)
+    
+    def record(self, name, start, end):
+        """
+        Records a phase that ran from start to end (time.perf_counter() values).
+        """
+        with self.lock:
+            if name not in self.durations:
+                self.durations[name] = RingBuffer(self.history_size)
+            self.durations[name].append(end - start)
+            self.trace_events.append((name, start, end, threading.get_ident()))
+    
+    def get_summary(self):
+        """
+        Returns the number of times every phase ran, and the mean and percentiles of its recent durations in milliseconds.
+        """
+        with self.lock:
+            durations = {name: (history.count, history.values()) for name, history in self.durations.items()}
+        
+        summary = {}
+        for name, (count, values) in durations.items():
+            summary[name] = {"count": count, "mean": float(np.mean(values)) * 1000}
+            for percentile, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+                summary[name][f"p{percentile}"] = float(value) * 1000
+        return summary
+    
+    def log_summary(self):
+        summary = self.get_summary()
+        if len(summary) == 0:
+            logger.info("Profiler: no phases recorded.")
+            return
+        for name, statistics in summary.items():
+            # Percentiles of a single duration say nothing, e.g. for the stages of a sweep that run once.
+            if statistics["count"] == 1:
+                logger.info(f"Profiler: {name}: 1 call, {statistics['mean']:.2f} ms.")
+                continue
+            logger.info(f"Profiler: {name}: {statistics['count']} calls, mean {statistics['mean']:.2f} ms, p50 {statistics['p50']:.2f} ms, p95 {statistics['p95']:.2f} ms, p99 {statistics['p99']:.2f} ms.")
+    
+    def export_chrome_trace(self, path):
+        """
+        Writes the recorded phases as a Chrome trace (JSON trace event format) to path.
+        """
+        with self.lock:
+            trace_events = list(self.trace_events)
+        
+        pid = os.getpid()
+        events = [{"name": name, "ph": "X", "ts": (start - self.origin) * 1e6, "dur": (end - start) * 1e6, "pid": pid, "tid": tid} for name, start, end, tid in trace_events]
+        with open(path, "w") as file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+        logger.info(f"Wrote {len(events)} profiler events to '{path}'.")
+
+class Phase:
+    
+    __slots__ = ["profiler", "name", "start"]
+    
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.record(self.name, self.start, time.perf_counter())
+        return False
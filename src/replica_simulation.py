@@ -0,0 +1,191 @@
+from loguru import logger
+import numpy as np
+
+from src.autocorrelation import integrated_autocorrelation_time
+from src.cluster import swendsen_wang_update, wolff_update
+from src.constants import *
+from src.simulation import calculate_nearest_neighbour_total_energy, checkerboard_masks, get_probability_tables, nearest_neighbour_sum, pick_spins, spin_table_index, NEIGHBOUR_SUM_OFFSET, UPDATE_SCHEMES
+
+class ReplicaSimulation:
+    """
+    Simulates a stack of independent lattices (replicas), one per temperature, advancing all of them with a single vectorized update. The update schemes are the same as those of Simulation.
+    
+    With a non-zero exchange_interval the replicas are coupled by parallel tempering: every exchange_interval updates, swaps of the lattices at neighbouring temperatures are proposed. The temperatures should then be sorted, as they form the temperature ladder. The exchange criterion assumes the replicas sample the Boltzmann distribution, which every update scheme except 'synchronous' does, so parallel tempering raises a ValueError with the 'synchronous' scheme.
+    """
+    
+    def __init__(self, temperatures, width=20, height=20, mode="nearest_neighbour", update_scheme="synchronous", exchange_interval=0, coupling_constant=NEAREST_NEIGHBOUR_COUPLING_CONSTANT, boltzmann_constant=BOLTZMANN_CONSTANT, external_field=0.0):
+        self.temperatures = np.asarray(temperatures, dtype=np.float64)
+        self.replicas = len(self.temperatures)
+        self.width = width
+        self.height = height
+        self.spins = np.random.choice(np.array([-1, +1], dtype=np.int8), size=(self.replicas, self.height, self.width))
+        
+        # Physical constants, J, k_B and the external field H.
+        self.coupling_constant = coupling_constant
+        self.boltzmann_constant = boltzmann_constant
+        self.external_field = external_field
+        self.average_spin_history = []
+        self.energy_history = []
+        
+        # Set mode.
+        available_modes = ["nearest_neighbour"]
+        if not (mode in available_modes):
+            logger.critical(f"Mode '{mode}' is not a valid mode! (Options: {available_modes})")
+        self.mode = mode
+        
+        # Set update scheme.
+        if not (update_scheme in UPDATE_SCHEMES):
+            logger.critical(f"Update scheme '{update_scheme}' is not a valid update scheme! (Options: {UPDATE_SCHEMES})")
+        self.update_scheme = update_scheme
+        check_exchange_interval(update_scheme, exchange_interval)
+        
+        # Split the lattice into two interpenetrating sublattices, nearest neighbours are always on the other sublattice.
+        self.checkerboard_masks = checkerboard_masks(self.width, self.height)
+        
+        # Stack the probability tables of all temperatures, row r belongs to replica r.
+        tables = [get_probability_tables(temperature, self.coupling_constant, self.boltzmann_constant, self.external_field) for temperature in self.temperatures]
+        self.spin_up_tables = np.stack([spin_up_table for spin_up_table, _ in tables])
+        self.acceptance_tables = np.stack([acceptance_table for _, acceptance_table in tables])
+        self.replica_index = np.arange(self.replicas)[:, None]
+        
+        # Replica exchange state. A walker is a lattice travelling along the temperature ladder, walkers[i] is the walker currently at temperature i.
+        self.exchange_interval = exchange_interval
+        self.exchange_parity = 0
+        self.exchange_attempts = np.zeros(max(self.replicas - 1, 0), dtype=np.int64)
+        self.exchange_accepts = np.zeros(max(self.replicas - 1, 0), dtype=np.int64)
+        self.walkers = np.arange(self.replicas)
+        self.walker_directions = np.zeros(self.replicas, dtype=np.int8) # +1: last visited the lowest temperature, -1: last visited the highest temperature.
+        self.walker_round_trip_starts = np.zeros(self.replicas, dtype=np.int64)
+        self.round_trip_times = []
+    
+    def update(self):
+        if self.update_scheme == "synchronous":
+            self.update_synchronous()
+        elif self.update_scheme == "checkerboard_heat_bath":
+            self.update_checkerboard(metropolis=False)
+        elif self.update_scheme == "checkerboard_metropolis":
+            self.update_checkerboard(metropolis=True)
+        elif self.update_scheme == "wolff":
+            # Cluster updates cannot be batched, update the replicas one by one.
+            for spins, temperature in zip(self.spins, self.temperatures):
+                wolff_update(spins, temperature, self.coupling_constant, self.boltzmann_constant, self.external_field)
+        elif self.update_scheme == "swendsen_wang":
+            for spins, temperature in zip(self.spins, self.temperatures):
+                swendsen_wang_update(spins, temperature, self.coupling_constant, self.boltzmann_constant, self.external_field)
+        
+        # Propose replica exchanges.
+        if self.exchange_interval > 0 and (len(self.average_spin_history) + 1) % self.exchange_interval == 0:
+            self.exchange_replicas()
+        
+        # Append average spin and energy of every replica to the histories.
+        self.average_spin_history.append(self.get_average_spins())
+        self.energy_history.append(self.get_energies())
+    
+    def update_synchronous(self):
+        """
+        Picks every new spin from the energy of the old lattices and flips all spins at once, see Simulation.update_synchronous().
+        """
+        # Flatten the lattices so a replica's probability tables can be selected with the replica index.
+        spin_index = spin_table_index(self.spins).reshape(self.replicas, -1)
+        neighbour_sum = nearest_neighbour_sum(self.spins).reshape(self.replicas, -1)
+        spin_up_prob = self.spin_up_tables[self.replica_index, spin_index, neighbour_sum + NEIGHBOUR_SUM_OFFSET]
+        self.spins = pick_spins(spin_up_prob).reshape(self.spins.shape)
+    
+    def update_checkerboard(self, metropolis=False):
+        """
+        Updates one sublattice of every replica at a time, see Simulation.update_checkerboard().
+        """
+        for mask in self.checkerboard_masks:
+            neighbour_sum = nearest_neighbour_sum(self.spins)[:, mask]
+            spins = self.spins[:, mask]
+            
+            if metropolis:
+                # Flip spins with probability min(1, exp(-dU / kT)), where dU = S_i * (J * sum(S_j) + 2H).
+                acceptance_prob = self.acceptance_tables[self.replica_index, spin_table_index(spins), neighbour_sum + NEIGHBOUR_SUM_OFFSET]
+                self.spins[:, mask] = spins * np.where(np.random.random(acceptance_prob.shape) < acceptance_prob, -1, +1).astype(np.int8)
+            else:
+                # Pick new spins from the energy of the spin up state, regardless of the current spin.
+                self.spins[:, mask] = pick_spins(self.spin_up_tables[self.replica_index, 1, neighbour_sum + NEIGHBOUR_SUM_OFFSET])
+    
+    def exchange_replicas(self):
+        """
+        Proposes swapping the lattices of neighbouring temperatures, alternating between the (0, 1), (2, 3), ... and the (1, 2), (3, 4), ... pairs. A swap is accepted with probability min(1, exp((beta_i - beta_j) * (E_i - E_j))).
+        """
+        # Select pairs of neighbouring temperatures.
+        lower = np.arange(self.exchange_parity, self.replicas - 1, 2)
+        upper = lower + 1
+        self.exchange_parity ^= 1
+        
+        # Accept or reject swaps.
+        beta = 1 / (self.boltzmann_constant * self.temperatures)
+        energies = self.get_energies()
+        log_acceptance = (beta[lower] - beta[upper]) * (energies[lower] - energies[upper])
+        accept = np.log(np.random.random(len(lower))) < log_acceptance
+        self.exchange_attempts[lower] += 1
+        self.exchange_accepts[lower[accept]] += 1
+        
+        # Swap lattices and walkers.
+        swap_from = np.concatenate([lower[accept], upper[accept]])
+        swap_to = np.concatenate([upper[accept], lower[accept]])
+        self.spins[swap_to] = self.spins[swap_from]
+        self.walkers[swap_to] = self.walkers[swap_from]
+        
+        # Track round trips from the lowest temperature to the highest temperature and back.
+        now = len(self.average_spin_history)
+        bottom_walker = self.walkers[0]
+        top_walker = self.walkers[-1]
+        if self.walker_directions[bottom_walker] != +1:
+            if self.walker_directions[bottom_walker] == -1:
+                self.round_trip_times.append(now - self.walker_round_trip_starts[bottom_walker])
+            self.walker_directions[bottom_walker] = +1
+            self.walker_round_trip_starts[bottom_walker] = now
+        if self.walker_directions[top_walker] == +1:
+            self.walker_directions[top_walker] = -1
+    
+    def get_exchange_acceptance_rates(self):
+        """
+        Returns the fraction of accepted swaps between temperature i and i + 1, for every i.
+        """
+        return self.exchange_accepts / np.maximum(self.exchange_attempts, 1)
+    
+    def get_mean_round_trip_time(self):
+        """
+        Returns the mean number of updates a lattice takes to travel from the lowest temperature to the highest temperature and back, or None if no round trip has been completed yet.
+        """
+        if len(self.round_trip_times) == 0:
+            return None
+        return float(np.mean(self.round_trip_times))
+    
+    def get_average_spins(self):
+        return np.sum(self.spins, axis=(1, 2), dtype=np.int64) / (self.width * self.height)
+    
+    def get_energies(self):
+        if self.mode == "nearest_neighbour":
+            return calculate_nearest_neighbour_total_energy(self.spins, self.coupling_constant, self.external_field)
+    
+    @property
+    def average_spin_over_time(self):
+        """
+        Average spin of every replica over time, with shape (replicas, updates). Row r is the equivalent of Simulation.average_spin_over_time for replica r.
+        """
+        return np.array(self.average_spin_history).reshape(-1, self.replicas).T
+    
+    @property
+    def energy_over_time(self):
+        """
+        Total energy of every replica over time, with shape (replicas, updates).
+        """
+        return np.array(self.energy_history).reshape(-1, self.replicas).T
+    
+    def get_autocorrelation_times(self):
+        """
+        Returns the integrated autocorrelation time of the average spin of every replica, in updates.
+        """
+        return np.array([integrated_autocorrelation_time(average_spins) for average_spins in self.average_spin_over_time])
+
+def check_exchange_interval(update_scheme, exchange_interval):
+    """
+    Raises a ValueError if parallel tempering (a non-zero exchange_interval) is combined with the 'synchronous' update scheme, which does not sample the Boltzmann distribution the exchange criterion assumes.
+    """
+    if exchange_interval > 0 and update_scheme == "synchronous":
+        raise ValueError("The 'synchronous' update scheme does not sample the Boltzmann distribution, replica exchange does not apply to it!")
@@ -0,0 +1,79 @@
+import sqlite3
+import time
+
+# Columns identifying a simulated point, together they are the key of the results table.
+PARAMETER_COLUMNS = {
+    "width": "INTEGER",
+    "height": "INTEGER",
+    "temperature": "REAL",
+    "coupling_constant": "REAL",
+    "boltzmann_constant": "REAL",
+    "external_field": "REAL",
+    "update_scheme": "TEXT",
+    "exchange_interval": "INTEGER",
+    "thermalization_sweeps": "INTEGER",
+    "sweeps": "INTEGER",
+    "seed": "INTEGER",
+}
+
+# Columns holding the measured observables of a point.
+RESULT_COLUMNS = {
+    "mean_magnetization": "REAL",
+    "mean_absolute_magnetization": "REAL",
+    "mean_energy": "REAL",
+    "susceptibility": "REAL",
+    "specific_heat": "REAL",
+    "binder_cumulant": "REAL",
+    "autocorrelation_time": "REAL",
+}
+
+class ResultStore:
+    """
+    Append-only SQLite store of simulation results, keyed by the parameters of every point (PARAMETER_COLUMNS). Results are only ever inserted, a point that is already stored is never overwritten, so an interrupted sweep can resume by skipping the points that are stored.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        
+        # Write ahead logging, readers (e.g. a notebook looking at partial results) do not block the sweep.
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        
+        columns = [f"{name} {column_type} NOT NULL" for name, column_type in PARAMETER_COLUMNS.items()]
+        columns += [f"{name} {column_type}" for name, column_type in RESULT_COLUMNS.items()]
+        columns += ["created TEXT NOT NULL", f"PRIMARY KEY ({', '.join(PARAMETER_COLUMNS)})"]
+        with self.connection:
+            self.connection.execute(f"CREATE TABLE IF NOT EXISTS results ({', '.join(columns)})")
+    
+    def contains(self, parameters):
+        """
+        Returns whether the point with these parameters (a dict holding every parameter column) is stored.
+        """
+        condition = " AND ".join(f"{name} = ?" for name in PARAMETER_COLUMNS)
+        cursor = self.connection.execute(f"SELECT 1 FROM results WHERE {condition}", [parameters[name] for name in PARAMETER_COLUMNS])
+        return cursor.fetchone() is not None
+    
+    def add(self, rows):
+        """
+        Inserts the rows (dicts holding every parameter and result column) in a single transaction, skipping points that are already stored.
+        """
+        names = list(PARAMETER_COLUMNS) + list(RESULT_COLUMNS) + ["created"]
+        created = time.strftime("%Y-%m-%dT%H:%M:%S")
+        values = [[row[name] for name in PARAMETER_COLUMNS] + [row.get(name) for name in RESULT_COLUMNS] + [created] for row in rows]
+        with self.connection:
+            self.connection.executemany(f"INSERT OR IGNORE INTO results ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})", values)
+    
+    def get_results(self, **parameters):
+        """
+        Returns the stored rows (as dicts) matching the given parameter values, ordered by lattice size and temperature.
+        """
+        for name in parameters:
+            if name not in PARAMETER_COLUMNS:
+                raise ValueError(f"Unknown parameter '{name}'. (Options: {list(PARAMETER_COLUMNS)})")
+        condition = " AND ".join(f"{name} = ?" for name in parameters) if parameters else "1"
+        cursor = self.connection.execute(f"SELECT * FROM results WHERE {condition} ORDER BY width, height, temperature", list(parameters.values()))
+        return [dict(row) for row in cursor.fetchall()]
+    
+    def close(self):
+        self.connection.close()
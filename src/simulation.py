@@ -1,53 +1,280 @@
+from functools import lru_cache
+import math
+
 from loguru import logger
 import numpy as np
-import pygame
 
+from src.autocorrelation import integrated_autocorrelation_time
+from src.cluster import swendsen_wang_update, wolff_update
 from src.constants import *
+from src.observables import Observables
+
+# Neighbour sums lie in -4..4, adding this offset turns them into table indices.
+NEIGHBOUR_SUM_OFFSET = 4
+
+# Number of probability tables to keep, one per (temperature, J, k_B, H) combination.
+PROBABILITY_TABLE_CACHE_SIZE = 32
+
+# Update schemes of Simulation and ReplicaSimulation. The sublattice schemes need a colouring of the lattice, the cluster schemes nearest neighbour interaction.
+UPDATE_SCHEMES = ["synchronous", "checkerboard_heat_bath", "checkerboard_metropolis", "wolff", "swendsen_wang"]
+SUBLATTICE_UPDATE_SCHEMES = ["checkerboard_heat_bath", "checkerboard_metropolis"]
+CLUSTER_UPDATE_SCHEMES = ["wolff", "swendsen_wang"]
 
 class Simulation:
     
-    def __init__(self, width=10, height=10, mode="nearest_neighbour"):
+    def __init__(self, width=10, height=10, mode="nearest_neighbour", update_scheme="synchronous", history_capacity=10000, check_totals=False, coupling_constant=NEAREST_NEIGHBOUR_COUPLING_CONSTANT, boltzmann_constant=BOLTZMANN_CONSTANT, external_field=0.0, interaction=None):
         self.width = width
         self.height = height
-        self.spins = [[int(np.random.choice([-1, +1])) for _ in range(self.width)] for _ in range(self.height)]
-        self.average_spin_over_time = []
+        self.spins = np.random.choice(np.array([-1, +1], dtype=np.int8), size=(self.height, self.width))
+        
+        # Physical constants, J, k_B and the external field H.
+        self.coupling_constant = coupling_constant
+        self.boltzmann_constant = boltzmann_constant
+        self.external_field = external_field
+        
+        # Observables, the running statistics describe the run at a single temperature (the temperature of the last update).
+        self.observables = Observables(self.width * self.height, history_capacity=history_capacity)
+        self.temperature = None
+        self.sweeps = 0
+        
+        # Optional trajectory recorder, see attach_recorder().
+        self.recorder = None
         
-        # Set mode.
-        available_modes = ["nearest_neighbour"]
+        # Set mode. The 'interaction' mode takes its couplings from the interaction (see src.interactions), e.g. next-nearest neighbour, long-range or arbitrary graph couplings.
+        available_modes = ["nearest_neighbour", "interaction"]
         if not (mode in available_modes):
             logger.critical(f"Mode '{mode}' is not a valid mode! (Options: {available_modes})")
         self.mode = mode
+        self.interaction = interaction
+        if self.mode == "interaction" and self.interaction is None:
+            raise ValueError("Mode 'interaction' requires an interaction!")
+        if self.mode == "interaction" and self.interaction.shape not in [None, (self.height, self.width)]:
+            raise ValueError(f"Interaction is made for a {self.interaction.shape[1]}x{self.interaction.shape[0]} lattice, not for a {self.width}x{self.height} lattice!")
+        
+        # Set update scheme.
+        if not (update_scheme in UPDATE_SCHEMES):
+            logger.critical(f"Update scheme '{update_scheme}' is not a valid update scheme! (Options: {UPDATE_SCHEMES})")
+        self.update_scheme = update_scheme
+        
+        # Split the lattice into two interpenetrating sublattices, nearest neighbours are always on the other sublattice. Other interactions need a colouring with more sublattices (or have none, when every spin interacts with every other spin).
+        self.checkerboard_masks = None
+        if self.mode == "nearest_neighbour":
+            self.checkerboard_masks = checkerboard_masks(self.width, self.height)
+        elif self.mode == "interaction":
+            self.checkerboard_masks = self.interaction.get_coloring(self.width, self.height)
+        
+        # Other interactions only support some update schemes, running any other scheme would be silently wrong.
+        if self.mode == "interaction" and update_scheme in CLUSTER_UPDATE_SCHEMES:
+            raise ValueError(f"Update scheme '{update_scheme}' only supports nearest neighbour interaction! (Options: {[scheme for scheme in UPDATE_SCHEMES if scheme not in CLUSTER_UPDATE_SCHEMES]})")
+        if self.mode == "interaction" and update_scheme == "synchronous" and self.checkerboard_masks is None:
+            raise ValueError(f"Update scheme 'synchronous' does not sample interactions without a colouring (e.g. long-range interactions), their spins must be updated one at a time! (Options: {SUBLATTICE_UPDATE_SCHEMES})")
+        
+        # Running totals of the magnetization (sum of all spins) and energy, updated from the flips of every update. With check_totals they are compared to a full recomputation after every update.
+        self.check_totals = check_totals
+        self.recalculate_totals()
     
     def update(self, temperature):
-        # Calculate energy for every spin.
-        energy_matrix = [[0 for _ in range(self.width)] for _ in range(self.height)]
-        for y, row in enumerate(self.spins):
-            for x, spin in enumerate(row):
-                if self.mode == "nearest_neighbour":
-                    # Get nearest neighbour spins.
-                    neighbour_spin_left   = self.get_spin(x - 1, y)
-                    neighbour_spin_right  = self.get_spin(x + 1, y)
-                    neighbour_spin_bottom = self.get_spin(x, y - 1)
-                    neighbour_spin_top    = self.get_spin(x, y + 1)
-                    neighbour_spins = [neighbour_spin_left, neighbour_spin_right, neighbour_spin_bottom, neighbour_spin_top]
-                    
-                    # Keep only spins that are not None (e.g. spins that are in the field and thus actually exist).
-                    neighbour_spins = [spin for spin in neighbour_spins if not (spin is None)]
-                    
-                    # Calculate energy from nearest neighbours and store into energy matrix.
-                    energy_matrix[y][x] = calculate_nearest_neighbour_spin_energy(spin, neighbour_spins)
-        
-        # Random choose next spin value for each spin from the energy.
-        new_spins = [[0 for _ in range(self.width)] for _ in range(self.height)]
-        for y, row in enumerate(energy_matrix):
-            for x, energy in enumerate(row):
-                new_spins[y][x] = pick_random_spin(energy, temperature)
-        
-        # Overwrite old spins.
-        self.spins = new_spins
-        
-        # Append average spin to cummulative list.
-        self.average_spin_over_time.append(self.get_average_spin())
+        # Statistics from another temperature do not describe this one, start over.
+        if temperature != self.temperature:
+            self.observables.reset()
+            self.temperature = temperature
+        
+        if self.mode == "interaction":
+            self.update_interaction(temperature)
+        elif self.update_scheme == "synchronous":
+            self.update_synchronous(temperature)
+        elif self.update_scheme == "checkerboard_heat_bath":
+            self.update_checkerboard(temperature, metropolis=False)
+        elif self.update_scheme == "checkerboard_metropolis":
+            self.update_checkerboard(temperature, metropolis=True)
+        elif self.update_scheme == "wolff":
+            self.add_cluster_flips(wolff_update(self.spins, temperature, self.coupling_constant, self.boltzmann_constant, self.external_field))
+        elif self.update_scheme == "swendsen_wang":
+            self.add_cluster_flips(swendsen_wang_update(self.spins, temperature, self.coupling_constant, self.boltzmann_constant, self.external_field))
+        
+        # Compare running totals to a full recomputation.
+        if self.check_totals:
+            self.verify_totals()
+        
+        # Add average spin and energy to the observables.
+        self.sweeps += 1
+        self.observables.add(self.get_average_spin(), self.get_energy())
+        
+        # Hand the lattice to the trajectory recorder.
+        if self.recorder is not None:
+            self.recorder.record(self.sweeps, self.spins)
+    
+    def attach_recorder(self, recorder):
+        """
+        Records the lattice after every update with the recorder (e.g. a TrajectoryRecorder), which decides what to keep. Pass None to stop recording.
+        """
+        self.recorder = recorder
+    
+    def update_synchronous(self, temperature):
+        """
+        Picks every new spin from the energy of the old lattice and flips all spins at once. Nearest neighbour mode only, see update_interaction() for the 'interaction' mode.
+        """
+        spin_up_table, _ = self.get_probability_tables(temperature)
+        
+        # Look up spin up probability from the energy of every spin, U_i = -J/2 * S_i * sum(S_j) - H * S_i.
+        spin_up_prob = spin_up_table[spin_table_index(self.spins), nearest_neighbour_sum(self.spins) + NEIGHBOUR_SUM_OFFSET]
+        
+        # Random choose next spin value for each spin, and overwrite old spins.
+        self.spins = pick_spins(spin_up_prob)
+        
+        # Every spin may have changed together with its neighbours, flip by flip tracking does not apply, recalculate the totals in one go.
+        self.recalculate_totals()
+    
+    def update_checkerboard(self, temperature, metropolis=False):
+        """
+        Updates one sublattice at a time. Spins on the same sublattice do not interact, so updating a whole sublattice at once is equivalent to updating its spins one after another. Nearest neighbour mode only, see update_interaction() for the 'interaction' mode.
+        """
+        spin_up_table, acceptance_table = self.get_probability_tables(temperature)
+        
+        for mask in self.checkerboard_masks:
+            neighbour_sum = nearest_neighbour_sum(self.spins)[mask]
+            old_spins = self.spins[mask]
+            if metropolis:
+                # Flip spins with probability min(1, exp(-dU / kT)), where dU = S_i * (J * sum(S_j) + 2H).
+                acceptance_prob = acceptance_table[spin_table_index(old_spins), neighbour_sum + NEIGHBOUR_SUM_OFFSET]
+                flipped = np.random.random(acceptance_prob.shape) < acceptance_prob
+                self.spins[mask] = np.where(flipped, -old_spins, old_spins)
+            else:
+                # Pick new spins from the energy of the spin up state, regardless of the current spin.
+                new_spins = pick_spins(spin_up_table[1, neighbour_sum + NEIGHBOUR_SUM_OFFSET])
+                flipped = new_spins != old_spins
+                self.spins[mask] = new_spins
+            
+            # The neighbours are on the other sublattice and did not change, so every flip changes the energy by exactly dU.
+            flipped_spins = old_spins[flipped]
+            flipped_magnetization = int(np.sum(flipped_spins, dtype=np.int64))
+            self.total_magnetization -= 2 * flipped_magnetization
+            self.total_energy += self.coupling_constant * int(np.sum(flipped_spins * neighbour_sum[flipped], dtype=np.int64)) + 2 * self.external_field * flipped_magnetization
+    
+    def update_interaction(self, temperature):
+        """
+        Updates the lattice in the 'interaction' mode, with the synchronous scheme or one colour of the interaction at a time with the checkerboard schemes (one spin at a time if the interaction has no colouring, see update_sequential()). The local fields h_i = sum(J_ij * S_j) take arbitrary values, so the probabilities are calculated directly instead of looked up.
+        """
+        if self.update_scheme not in ["synchronous"] + SUBLATTICE_UPDATE_SCHEMES:
+            raise ValueError(f"Update scheme '{self.update_scheme}' is not supported in the 'interaction' mode!")
+        
+        if self.checkerboard_masks is None:
+            self.update_sequential(temperature, metropolis=self.update_scheme == "checkerboard_metropolis")
+            return
+        
+        if self.update_scheme == "synchronous":
+            # Pick every new spin from the energy of the old lattice, U_i = -1/2 * S_i * h_i - H * S_i.
+            local_field = self.interaction.local_field(self.spins)
+            self.spins = pick_random_spin(calculate_spin_energy(self.spins, local_field, self.external_field), temperature, self.boltzmann_constant)
+            self.recalculate_totals()
+            return
+        
+        for mask in self.checkerboard_masks:
+            local_field = self.interaction.local_field(self.spins)[mask]
+            old_spins = self.spins[mask]
+            if self.update_scheme == "checkerboard_metropolis":
+                # Flip spins with probability min(1, exp(-dU / kT)), where dU = S_i * (h_i + 2H).
+                acceptance_prob = metropolis_acceptance_probability(old_spins * (local_field + 2 * self.external_field), temperature, self.boltzmann_constant)
+                flipped = np.random.random(acceptance_prob.shape) < acceptance_prob
+                self.spins[mask] = np.where(flipped, -old_spins, old_spins)
+            else:
+                # Pick new spins from the energy of the spin up state, regardless of the current spin.
+                new_spins = pick_random_spin(calculate_spin_energy(1, local_field, self.external_field), temperature, self.boltzmann_constant)
+                flipped = new_spins != old_spins
+                self.spins[mask] = new_spins
+            
+            # Spins of the same colour do not interact, so every flip changes the energy by exactly dU.
+            flipped_spins = old_spins[flipped]
+            self.total_magnetization -= 2 * int(np.sum(flipped_spins, dtype=np.int64))
+            self.total_energy += float(np.sum(flipped_spins * (local_field[flipped] + 2 * self.external_field)))
+    
+    def update_sequential(self, temperature, metropolis=False):
+        """
+        Updates the spins one after another, for interactions without a colouring (e.g. long-range interactions, where every spin interacts with every other spin). The local fields are calculated once per update and kept up to date after every flip from the couplings of the flipped spin, O(N) per flip instead of a new convolution.
+        """
+        local_field = self.interaction.local_field(self.spins)
+        random = np.random.random((self.height, self.width)).tolist()
+        thermal_energy = temperature * self.boltzmann_constant
+        for y in range(self.height):
+            for x in range(self.width):
+                # Scalar maths, NumPy calls cost more than the arithmetic for a single spin.
+                spin = int(self.spins[y, x])
+                field = float(local_field[y, x]) + 2 * self.external_field
+                if metropolis:
+                    # Flip the spin with probability min(1, exp(-dU / kT)), where dU = S_i * (h_i + 2H).
+                    delta_energy = spin * field
+                    flipped = delta_energy <= 0 or random[y][x] < math.exp(-delta_energy / thermal_energy)
+                else:
+                    # Pick the new spin from the energy of the spin up state regardless of the current spin, spin up with probability 1 / (1 + exp(-(h_i + 2H) / kT)) (capped so exp does not overflow).
+                    spin_up = random[y][x] < 1 / (1 + math.exp(min(-field / thermal_energy, 700)))
+                    flipped = spin_up != (spin > 0)
+                if not flipped:
+                    continue
+                
+                # Flipping S_i changes the local field of every spin j by -2 * J_ij * S_i.
+                self.spins[y, x] = -spin
+                local_field -= 2 * spin * self.interaction.get_couplings(x, y, self.width, self.height)
+                self.total_magnetization -= 2 * spin
+                self.total_energy += spin * field
+    
+    def add_cluster_flips(self, flipped):
+        """
+        Updates the running totals after the spins in the flipped mask have been flipped together. Bonds within the flipped spins are unchanged, only bonds with unflipped neighbours (and the external field) change the energy.
+        """
+        old_spins = np.where(flipped, -self.spins, self.spins)
+        flipped_spins = old_spins[flipped]
+        flipped_magnetization = int(np.sum(flipped_spins, dtype=np.int64))
+        unflipped_neighbour_sum = nearest_neighbour_sum(np.where(flipped, 0, old_spins).astype(np.int8))[flipped]
+        self.total_energy += self.coupling_constant * int(np.sum(flipped_spins * unflipped_neighbour_sum, dtype=np.int64))
+        self.total_energy += 2 * self.external_field * flipped_magnetization
+        self.total_magnetization -= 2 * flipped_magnetization
+    
+    def recalculate_totals(self):
+        """
+        Recalculates the magnetization and energy totals from the whole lattice.
+        """
+        self.total_magnetization = int(np.sum(self.spins, dtype=np.int64))
+        if self.mode == "nearest_neighbour":
+            self.total_energy = float(calculate_nearest_neighbour_total_energy(self.spins, self.coupling_constant, self.external_field))
+        elif self.mode == "interaction":
+            self.total_energy = float(calculate_total_energy(self.spins, self.interaction.local_field(self.spins), self.external_field))
+    
+    def verify_totals(self):
+        """
+        Logs an error if the running totals differ from a full recalculation.
+        """
+        total_magnetization, total_energy = self.total_magnetization, self.total_energy
+        self.recalculate_totals()
+        if total_magnetization != self.total_magnetization or not np.isclose(total_energy, self.total_energy):
+            logger.error(f"Running totals (magnetization: {total_magnetization}, energy: {total_energy}) differ from recalculated totals (magnetization: {self.total_magnetization}, energy: {self.total_energy})!")
+    
+    def get_probability_tables(self, temperature):
+        """
+        Returns the (cached) spin up and Metropolis acceptance probability tables for this temperature, see get_probability_tables().
+        """
+        return get_probability_tables(temperature, self.coupling_constant, self.boltzmann_constant, self.external_field)
+    
+    @property
+    def average_spin_over_time(self):
+        """
+        Ring buffer holding the average spin of the most recent updates.
+        """
+        return self.observables.average_spin_history
+    
+    def get_susceptibility(self):
+        return self.observables.get_susceptibility(self.temperature, self.boltzmann_constant)
+    
+    def get_specific_heat(self):
+        return self.observables.get_specific_heat(self.temperature, self.boltzmann_constant)
+    
+    def get_binder_cumulant(self):
+        return self.observables.get_binder_cumulant()
+    
+    def get_autocorrelation_time(self):
+        """
+        Returns the integrated autocorrelation time of the average spin over the stored history, in updates. For the 'wolff' scheme an update flips a single cluster rather than sweeping the whole lattice.
+        """
+        return integrated_autocorrelation_time(self.average_spin_over_time.values())
     
     def get_spin(self, x, y):
         """
@@ -57,77 +284,123 @@ class Simulation:
             return None
         if y < 0 or y >= self.height:
             return None
-        return self.spins[y][x]
+        return int(self.spins[y, x])
     
     def get_average_spin(self):
-        return sum([sum(row) for row in self.spins]) / (self.width * self.height)
+        return self.total_magnetization / (self.width * self.height)
+    
+    def get_energy(self):
+        return self.total_energy
     
     def render(self, display, font, resolution, zoom, render_mode):
-        for y, row in enumerate(self.spins):
-            for x, spin in enumerate(row):
-                if render_mode == "arrow":
-                    self.render_spin_arrow(display, resolution, x, y, spin, zoom)
-                elif render_mode == "rectangle":
-                    self.render_spin_rectangle(display, resolution, x, y, spin, zoom)
-                else:
-                    continue
+        # Imported here, so simulations run without pygame (e.g. headless batch runs).
+        from src.lattice_renderer import render_lattice
+        render_lattice(display, self.spins, resolution, zoom, render_mode)
+
+def nearest_neighbour_sum(spins):
+    """
+    Returns the sum of the nearest neighbour spins of every spin in the lattice. Neighbours outside of the lattice do not exist (open boundaries), so edge and corner spins only sum over three and two neighbours respectively.
+    """
+    neighbour_sum = np.zeros(spins.shape, dtype=np.int8)
+    neighbour_sum[..., :, 1:]  += spins[..., :, :-1] # Left neighbour.
+    neighbour_sum[..., :, :-1] += spins[..., :, 1:]  # Right neighbour.
+    neighbour_sum[..., 1:, :]  += spins[..., :-1, :] # Bottom neighbour.
+    neighbour_sum[..., :-1, :] += spins[..., 1:, :]  # Top neighbour.
+    return neighbour_sum
+
+def checkerboard_masks(width, height):
+    """
+    Returns boolean masks of the even ((x + y) % 2 == 0) and odd sublattices.
+    """
+    y, x = np.indices((height, width))
+    even = (x + y) % 2 == 0
+    return [even, ~even]
+
+def spin_table_index(spins):
+    """
+    Returns the row of the probability tables for every spin, 0 for spin down and 1 for spin up.
+    """
+    return (spins > 0).astype(np.intp)
+
+def calculate_nearest_neighbour_spin_energy(spin, neighbour_sum, coupling_constant=NEAREST_NEIGHBOUR_COUPLING_CONSTANT, external_field=0.0):
+    """
+    Calculate U_i for this particular spin with nearest neighbour interaction, see calculate_spin_energy() for other interactions.
     
-    def render_spin_arrow(self, display, resolution, x, y, spin, zoom):
-        # Calculate screen position.
-        SPIN_SEPARATION = 50
-        spin_x = resolution[0] / 2 + (x - self.width / 2) * SPIN_SEPARATION * zoom
-        spin_y = resolution[1] / 2 + (y - self.height / 2) * SPIN_SEPARATION * zoom
-        
-        # Render arrow at spin position.
-        half_line_length = 10 * zoom
-        pygame.draw.line(display, (255, 255, 255), (spin_x, spin_y - half_line_length), (spin_x, spin_y + half_line_length))
-        if spin == -1:
-            pygame.draw.line(display, (255, 255, 255), (spin_x, spin_y + half_line_length), (spin_x - half_line_length * 0.4, spin_y + half_line_length * 0.6))
-            pygame.draw.line(display, (255, 255, 255), (spin_x, spin_y + half_line_length), (spin_x + half_line_length * 0.4, spin_y + half_line_length * 0.6))
-        elif spin == +1:
-            pygame.draw.line(display, (255, 255, 255), (spin_x, spin_y - half_line_length), (spin_x - half_line_length * 0.4, spin_y - half_line_length * 0.6))
-            pygame.draw.line(display, (255, 255, 255), (spin_x, spin_y - half_line_length), (spin_x + half_line_length * 0.4, spin_y - half_line_length * 0.6))
-        else:
-            pygame.draw.circle(display, (0, 0, 255), (spin_x, spin_y), half_line_length)
-    
-    def render_spin_rectangle(self, display, resolution, x, y, spin, zoom):
-        # Calculate screen position.
-        SPIN_SEPARATION = 50
-        spin_x = resolution[0] / 2 + (x - self.width / 2) * SPIN_SEPARATION * zoom
-        spin_y = resolution[1] / 2 + (y - self.height / 2) * SPIN_SEPARATION * zoom
-        
-        # Render rectangle at spin position.
-        if spin == 1:
-            rect_color = (0, 255, 0)
-        elif spin == -1:
-            rect_color = (255, 0, 0)
-        else:
-            rect_color = (0, 0, 255)
-        pygame.draw.rect(display, rect_color, (spin_x, spin_y, SPIN_SEPARATION * zoom, SPIN_SEPARATION * zoom))
-
-def calculate_nearest_neighbour_spin_energy(spin, neighbour_spins):
-    """
-    Calculate U_i for this particular spin. This function will be more specific in the future, when more 'exotic' interactions are examined (e.g. next-nearest neighbours, general interaction between all spins, or external fields). Specifically, this function will have a name involving 'nearest_neighbours' or something.
+    Works on single spins as well as on whole lattices, in which case neighbour_sum is the array returned by nearest_neighbour_sum().
     """
     # Calculate energy.
-    J = NEAREST_NEIGHBOUR_COUPLING_CONSTANT
-    energy = -J/2 * spin * sum(neighbour_spins)
+    J = coupling_constant
+    energy = -J/2 * spin * neighbour_sum - external_field * spin
     return energy
 
-def pick_random_spin(energy, temperature):
-    # Calculate proportionality factor for spin up and spin down.
-    spin_up_factor   = np.exp(-energy / (temperature * BOLTZMANN_CONSTANT))
-    spin_down_factor = np.exp(energy / (temperature * BOLTZMANN_CONSTANT))
-    
-    # Calculate normalized probabilities.
-    spin_up_prob   = spin_up_factor / (spin_up_factor + spin_down_factor)
-    spin_down_prob = spin_down_factor / (spin_up_factor + spin_down_factor)
+def calculate_nearest_neighbour_total_energy(spins, coupling_constant=NEAREST_NEIGHBOUR_COUPLING_CONSTANT, external_field=0.0):
+    """
+    Returns the total energy of the lattice (or of every lattice in a stack of lattices) whose Boltzmann weight the update schemes sample, E = -J/4 * sum(S_i * sum(S_j)) - H * sum(S_i). Flipping a single spin changes it by exactly the dU = S_i * (J * sum(S_j) + 2H) used by the update schemes, which makes the interaction part half the sum of the spin energies U_i.
+    """
+    J = coupling_constant
+    energy = -J/4 * np.sum(spins * nearest_neighbour_sum(spins), axis=(-2, -1), dtype=np.int64)
+    if external_field != 0:
+        energy = energy - external_field * np.sum(spins, axis=(-2, -1), dtype=np.int64)
+    return energy
+
+def calculate_spin_energy(spin, local_field, external_field=0.0):
+    """
+    Returns U_i = -1/2 * S_i * h_i - H * S_i for any interaction, where h_i = sum(J_ij * S_j) is the local field of the spin (see src.interactions). With nearest neighbour interaction h_i = J * sum(S_j), which gives calculate_nearest_neighbour_spin_energy().
+    """
+    return -spin * (local_field / 2 + external_field)
+
+def calculate_total_energy(spins, local_field, external_field=0.0):
+    """
+    Returns the total energy E = -1/4 * sum(S_i * h_i) - H * sum(S_i) of the lattice (or of every lattice in a stack of lattices) for any interaction, see calculate_nearest_neighbour_total_energy().
+    """
+    return -1/4 * np.sum(spins * local_field, axis=(-2, -1)) - external_field * np.sum(spins, axis=(-2, -1), dtype=np.int64)
+
+def spin_up_probability(energy, temperature, boltzmann_constant=BOLTZMANN_CONSTANT):
+    """
+    Returns the probability of spin up, exp(-U / kT) / (exp(-U / kT) + exp(U / kT)), rewritten as a logistic function so it does not overflow at low temperatures.
+    """
+    with np.errstate(over="ignore"):
+        return 1 / (1 + np.exp(2 * energy / (temperature * boltzmann_constant)))
+
+def pick_random_spin(energy, temperature, boltzmann_constant=BOLTZMANN_CONSTANT):
+    """
+    Picks a new spin for every energy in the (array of) energies.
+    """
+    # Calculate normalized probability for spin up.
+    spin_up_prob = spin_up_probability(energy, temperature, boltzmann_constant)
     
-    # Draw random integer.
-    rand_int = np.random.randint(low=0, high=1e6)
+    # Draw new spins.
+    return pick_spins(spin_up_prob)
+
+def pick_spins(spin_up_prob):
+    """
+    Draws a spin for every spin up probability in the array.
+    """
+    return np.where(np.random.random(np.shape(spin_up_prob)) < spin_up_prob, +1, -1).astype(np.int8)
+
+def metropolis_acceptance_probability(delta_energy, temperature, boltzmann_constant=BOLTZMANN_CONSTANT):
+    """
+    Returns the Metropolis acceptance probability min(1, exp(-dU / kT)) for a change in energy dU.
+    """
+    with np.errstate(over="ignore"):
+        return np.minimum(1, np.exp(-delta_energy / (temperature * boltzmann_constant)))
+
+@lru_cache(maxsize=PROBABILITY_TABLE_CACHE_SIZE)
+def get_probability_tables(temperature, coupling_constant, boltzmann_constant, external_field=0.0):
+    """
+    Returns the spin up probability and the Metropolis acceptance probability for every spin and nearest neighbour sum. Both tables are indexed by [spin_table_index(S_i), sum(S_j) + NEIGHBOUR_SUM_OFFSET]:
+    - spin up probability for a spin with energy U = -J/2 * S_i * sum(S_j) - H * S_i, the row of spin up is the heat bath probability,
+    - acceptance probability for flipping the spin, dU = S_i * (J * sum(S_j) + 2H).
+    The tables are cached by temperature and constants, so changing either of them simply selects (or builds) another table.
+    """
+    spin = np.array([-1, +1])[:, None]
+    neighbour_sum = np.arange(-NEIGHBOUR_SUM_OFFSET, NEIGHBOUR_SUM_OFFSET + 1)[None, :]
+    local_field = spin * (coupling_constant * neighbour_sum + 2 * external_field)
+    with np.errstate(over="ignore"):
+        spin_up_table = 1 / (1 + np.exp(-local_field / (temperature * boltzmann_constant)))
+        acceptance_table = np.minimum(1, np.exp(-local_field / (temperature * boltzmann_constant)))
     
-    # Return new spin.
-    if rand_int < spin_up_prob * 1e6:
-        return +1
-    else:
-        return -1
+    # Cached tables are shared, make sure nobody modifies them.
+    spin_up_table.flags.writeable = False
+    acceptance_table.flags.writeable = False
+    return spin_up_table, acceptance_table
@@ -0,0 +1,119 @@
+import threading
+import time
+
+import numpy as np
+
+from src.profiler import Profiler
+
+class SimulationSnapshot:
+    """
+    Consistent copy of the simulation state after some update, everything the visualizer needs to render a frame.
+    """
+    
+    def __init__(self, spins, average_spin, energy, sweeps, average_spin_times, average_spin_values):
+        self.spins = spins
+        self.average_spin = average_spin
+        self.energy = energy
+        self.sweeps = sweeps
+        self.average_spin_times = average_spin_times
+        self.average_spin_values = average_spin_values
+
+def take_snapshot(simulation, copy=True):
+    """
+    Returns a snapshot of the simulation. Without copy the snapshot shares the lattice with the simulation, which is only safe while the simulation is not updated.
+    """
+    spins = simulation.spins.copy() if copy else simulation.spins
+    history = simulation.average_spin_over_time
+    return SimulationSnapshot(spins, simulation.get_average_spin(), simulation.get_energy(), simulation.sweeps, history.times(), history.values())
+
+class SimulationWorker:
+    """
+    Advances a simulation on a background thread, as fast as possible or at a target number of sweeps per second.
+    
+    Snapshots are handed to the render thread through two buffers: get_snapshot() returns the latest snapshot and marks it as taken, and the worker only publishes a new snapshot (into the other buffer) once the latest one has been taken. The render thread may therefore use a snapshot until its next call to get_snapshot().
+    
+    An exception raised by an update (e.g. a trajectory recorder failing to write) stops the worker and is stored in error, the render thread has to check it every frame.
+    """
+    
+    def __init__(self, simulation, temperature, target_sweeps_per_second=None, profiler=None):
+        self.simulation = simulation
+        self.temperature = temperature
+        self.target_sweeps_per_second = target_sweeps_per_second
+        self.profiler = profiler if profiler is not None else Profiler(enabled=False)
+        
+        # Double buffered snapshots.
+        self.lock = threading.Lock()
+        self.snapshots = [take_snapshot(simulation), None]
+        self.latest = 0
+        self.taken = True
+        
+        self.running = False
+        self.thread = None
+        self.error = None
+    
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+    
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+    
+    def set_temperature(self, temperature):
+        self.temperature = temperature
+    
+    def get_snapshot(self):
+        with self.lock:
+            self.taken = True
+            return self.snapshots[self.latest]
+    
+    def run(self):
+        # An uncaught exception would silently end the thread and leave the window on the last snapshot, hand it to the render thread instead.
+        try:
+            self.run_updates()
+        except Exception as error:
+            self.error = error
+            self.running = False
+    
+    def run_updates(self):
+        next_sweep_time = time.perf_counter()
+        while self.running:
+            with self.profiler.phase("worker_update"):
+                self.simulation.update(self.temperature)
+            
+            # Publish a snapshot if the render thread has taken the latest one, the other buffer is free then.
+            if self.taken:
+                with self.profiler.phase("worker_publish"):
+                    self.publish()
+            
+            # Wait for the next sweep if a target rate is set. Do not try to catch up after falling behind by more than a second.
+            if self.target_sweeps_per_second:
+                next_sweep_time += 1 / self.target_sweeps_per_second
+                now = time.perf_counter()
+                if next_sweep_time > now:
+                    time.sleep(next_sweep_time - now)
+                elif now - next_sweep_time > 1:
+                    next_sweep_time = now
+    
+    def publish(self):
+        back = 1 - self.latest
+        snapshot = self.snapshots[back]
+        if snapshot is None or snapshot.spins.shape != self.simulation.spins.shape:
+            snapshot = take_snapshot(self.simulation)
+        else:
+            # Reuse the lattice buffer of the previous snapshot in this slot.
+            np.copyto(snapshot.spins, self.simulation.spins)
+            history = self.simulation.average_spin_over_time
+            snapshot.average_spin = self.simulation.get_average_spin()
+            snapshot.energy = self.simulation.get_energy()
+            snapshot.sweeps = self.simulation.sweeps
+            snapshot.average_spin_times = history.times()
+            snapshot.average_spin_values = history.values()
+        
+        with self.lock:
+            self.snapshots[back] = snapshot
+            self.latest = back
+            self.taken = False
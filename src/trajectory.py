@@ -0,0 +1,180 @@
+import json
+import os
+import queue
+import threading
+
+from loguru import logger
+import numpy as np
+
+# A trajectory is a directory holding these files. Frames are bit-packed lattices (one bit per spin) of a fixed size, appended one after another, and the index holds the sweep number of every frame.
+METADATA_FILENAME = "metadata.json"
+FRAMES_FILENAME = "frames.bin"
+INDEX_FILENAME = "sweeps.bin"
+TRAJECTORY_VERSION = 1
+
+class TrajectoryRecorder:
+    """
+    Records the lattice every interval sweeps to a trajectory directory. Frames are bit-packed by the caller and written to disk by a background thread, so disk I/O never stalls the simulation. The simulation only waits if more than queue_size frames are waiting to be written.
+    
+    Attach the recorder with Simulation.attach_recorder(), or call record() after every update. Call close() when done. If writing fails (e.g. the disk is full), the error is raised from the next record() or close().
+    
+    Recording into an existing trajectory appends to it. Sweep numbers stay increasing: if the first recorded sweep is not after the last stored sweep (e.g. a new simulation counting from zero), every sweep of this recorder is offset by the last stored sweep.
+    """
+    
+    def __init__(self, path, width, height, interval=1, queue_size=1024):
+        self.path = path
+        self.width = width
+        self.height = height
+        self.interval = interval
+        
+        # Write metadata, or check that it matches when appending to an existing trajectory.
+        os.makedirs(path, exist_ok=True)
+        metadata = {"version": TRAJECTORY_VERSION, "width": width, "height": height, "frame_bytes": frame_bytes(width, height)}
+        metadata_path = os.path.join(path, METADATA_FILENAME)
+        if os.path.exists(metadata_path):
+            with open(metadata_path) as file:
+                if json.load(file) != metadata:
+                    raise ValueError(f"Existing trajectory '{path}' does not match a {width}x{height} lattice.")
+        else:
+            with open(metadata_path, "w") as file:
+                json.dump(metadata, file)
+        
+        # A crash may have left a partial frame or index entry behind, which would shift every frame appended after it. Cut both files back to the complete frames.
+        frames_path = os.path.join(path, FRAMES_FILENAME)
+        index_path = os.path.join(path, INDEX_FILENAME)
+        frame_count = complete_frame_count(frames_path, index_path, metadata["frame_bytes"])
+        for file_path, size in [(frames_path, frame_count * metadata["frame_bytes"]), (index_path, frame_count * 8)]:
+            if os.path.exists(file_path) and os.path.getsize(file_path) > size:
+                logger.warning(f"Truncating incomplete frame data at the end of '{file_path}'.")
+                os.truncate(file_path, size)
+        
+        # Last stored sweep, the sweeps of this recorder continue after it, see record().
+        self.last_sweep = None
+        if frame_count > 0:
+            self.last_sweep = int(np.fromfile(index_path, dtype=np.int64, count=1, offset=(frame_count - 1) * 8)[0])
+        self.sweep_offset = None
+        
+        # Files are only ever appended to.
+        self.frames_file = open(frames_path, "ab")
+        self.index_file = open(index_path, "ab")
+        
+        # Start writer thread. The first error it runs into is kept to be raised on the caller's thread.
+        self.error = None
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = threading.Thread(target=self.write_frames, daemon=True)
+        self.thread.start()
+    
+    def record(self, sweep, spins):
+        """
+        Queues the lattice for writing if sweep is a multiple of the interval.
+        """
+        if self.error is not None:
+            raise self.error
+        if sweep % self.interval != 0:
+            return
+        
+        # Decide on the first frame whether the sweeps continue the stored ones or start over, and have to be offset.
+        if self.sweep_offset is None:
+            self.sweep_offset = self.last_sweep if self.last_sweep is not None and sweep <= self.last_sweep else 0
+        self.queue.put((sweep + self.sweep_offset, np.packbits(spins > 0)))
+    
+    def write_frames(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            
+            # After an error, keep taking frames off the queue (without writing them), so record() never blocks on a full queue.
+            if self.error is not None:
+                continue
+            sweep, packed_spins = item
+            
+            try:
+                # Write the frame before its index entry, a reader never sees an index entry without its frame.
+                self.frames_file.write(packed_spins.tobytes())
+                self.index_file.write(np.int64(sweep).tobytes())
+                
+                # Flush once the queue is empty, so readers see the frames soon.
+                if self.queue.empty():
+                    self.frames_file.flush()
+                    self.index_file.flush()
+            except Exception as error:
+                logger.error(f"Writing trajectory '{self.path}' failed: {error}")
+                self.error = error
+    
+    def close(self):
+        """
+        Writes the remaining frames and closes the files.
+        """
+        self.queue.put(None)
+        self.thread.join()
+        try:
+            self.frames_file.close()
+            self.index_file.close()
+        except Exception as error:
+            if self.error is None:
+                self.error = error
+        if self.error is not None:
+            raise self.error
+        logger.info(f"Closed trajectory '{self.path}'.")
+
+class TrajectoryReader:
+    """
+    Random access to the frames of a trajectory directory. Frames are memory-mapped, only the frames that are read are loaded from disk.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, METADATA_FILENAME)) as file:
+            metadata = json.load(file)
+        if metadata["version"] != TRAJECTORY_VERSION:
+            raise ValueError(f"Trajectory version {metadata['version']} is not supported (expected version {TRAJECTORY_VERSION}).")
+        self.width = metadata["width"]
+        self.height = metadata["height"]
+        self.frame_bytes = metadata["frame_bytes"]
+        self.refresh()
+    
+    def refresh(self):
+        """
+        Maps the frames written so far, call again to see frames written after opening the reader.
+        """
+        frames_path = os.path.join(self.path, FRAMES_FILENAME)
+        index_path = os.path.join(self.path, INDEX_FILENAME)
+        
+        frame_count = complete_frame_count(frames_path, index_path, self.frame_bytes)
+        if frame_count == 0:
+            self.frames = np.zeros((0, self.frame_bytes), dtype=np.uint8)
+            self.sweeps = np.zeros(0, dtype=np.int64)
+            return
+        self.frames = np.memmap(frames_path, dtype=np.uint8, mode="r", shape=(frame_count, self.frame_bytes))
+        self.sweeps = np.memmap(index_path, dtype=np.int64, mode="r", shape=(frame_count,))
+    
+    def __len__(self):
+        return len(self.sweeps)
+    
+    def get_frame(self, index):
+        """
+        Returns frame index as an int8 lattice of -1 and +1 spins.
+        """
+        spins = np.unpackbits(self.frames[index], count=self.width * self.height).reshape(self.height, self.width)
+        return spins.astype(np.int8) * 2 - 1
+    
+    def get_sweep(self, index):
+        return int(self.sweeps[index])
+    
+    def find_frame(self, sweep):
+        """
+        Returns the index of the last frame recorded at or before sweep.
+        """
+        return max(0, int(np.searchsorted(self.sweeps, sweep, side="right")) - 1)
+
+def complete_frame_count(frames_path, index_path, frame_size):
+    """
+    Returns the number of frames of which both the frame (frame_size bytes) and its index entry are complete.
+    """
+    if not (os.path.exists(frames_path) and os.path.exists(index_path)):
+        return 0
+    return min(os.path.getsize(frames_path) // frame_size, os.path.getsize(index_path) // 8)
+
+def frame_bytes(width, height):
+    return -(-width * height // 8)
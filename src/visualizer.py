@@ -1,6 +1,14 @@
+from collections import deque, OrderedDict
+import time
+
 from loguru import logger
+import numpy as np
 import pygame
 
+from src.lattice_renderer import render_lattice
+from src.profiler import Profiler
+from src.simulation_worker import SimulationSnapshot, SimulationWorker, take_snapshot
+
 class TemperatureController:
     
     def __init__(self, initial_temperature):
@@ -84,11 +92,277 @@ class RenderModeController:
             self.render_mode = "arrow"
         if keys_pressed[pygame.K_r]:
             self.render_mode = "rectangle"
+
+class ReplayController:
+    
+    def __init__(self, frames):
+        # Frame variables.
+        self.frames = frames
+        self.frame_index = 0
+        self.paused = False
+        
+        # Variables to keep track of if the control keys have been released after being pressed.
+        self.space_released = True
+        self.right_released = True
+        self.left_released = True
+    
+    def get_frame_index(self):
+        return self.frame_index
+    
+    def handle_inputs(self, keys_pressed):
+        # Reset released flags.
+        if not keys_pressed[pygame.K_SPACE]:
+            self.space_released = True
+        if not keys_pressed[pygame.K_RIGHT]:
+            self.right_released = True
+        if not keys_pressed[pygame.K_LEFT]:
+            self.left_released = True
+        
+        # Toggle pause.
+        if keys_pressed[pygame.K_SPACE] and self.space_released:
+            self.paused = not self.paused
+            self.space_released = False
+        
+        # Step through frames while paused, play one frame per tick otherwise. Loop at the end.
+        if self.paused:
+            if keys_pressed[pygame.K_RIGHT] and self.right_released:
+                self.frame_index = (self.frame_index + 1) % self.frames
+                self.right_released = False
+            if keys_pressed[pygame.K_LEFT] and self.left_released:
+                self.frame_index = (self.frame_index - 1) % self.frames
+                self.left_released = False
+        else:
+            self.frame_index = (self.frame_index + 1) % self.frames
+
+class ProfilerController:
     
-def window(resolution=(1920, 1080), simulation=None):
-    if simulation is None:
+    def __init__(self, profiler):
+        # The overlay is shown while the profiler is enabled.
+        self.profiler = profiler
+        
+        # Variable to keep track of if the control key has been released after being pressed.
+        self.p_released = True
+    
+    def handle_inputs(self, keys_pressed):
+        # Reset released flag.
+        if not keys_pressed[pygame.K_p]:
+            self.p_released = True
+        
+        # Toggle profiler.
+        if keys_pressed[pygame.K_p] and self.p_released:
+            self.profiler.set_enabled(not self.profiler.enabled)
+            self.p_released = False
+
+class GraphPanel:
+    """
+    Graph of a growing series, e.g. the average spin over time, rendered incrementally so its cost does not grow with the length of the series.
+    
+    Points are decimated to one column per pixel: every column keeps the minimum and maximum of its points and the moving average at its last point. Once the columns are full, neighbouring columns are merged and every column covers twice as many points. Axes, labels and ticks are rendered to a cached background, which is only rebuilt when the bounds change.
+    """
+    
+    def __init__(self, small_font, big_font, position, size, moving_average_size=50, **kwargs):
+        self.small_font = small_font
+        self.big_font = big_font
+        self.position = position
+        self.size = size
+        self.moving_average_size = moving_average_size
+        
+        # Graph style.
+        self.axes_color = kwargs["axes_color"] if "axes_color" in kwargs else (255, 255, 255)
+        self.raw_data_color = kwargs["raw_data_color"] if "raw_data_color" in kwargs else (255, 255, 255)
+        self.moving_average_color = kwargs["moving_average_color"] if "moving_average_color" in kwargs else (255, 255, 255)
+        self.title = kwargs["title"] if "title" in kwargs else "Graph Title"
+        self.x_axis_label = kwargs["x_axis_label"] if "x_axis_label" in kwargs else "X Axis"
+        self.y_axis_label = kwargs["y_axis_label"] if "y_axis_label" in kwargs else "Y Axis"
+        
+        # One column per pixel of the x axis.
+        self.bottomleft = (position[0] + 10, position[1] + 10)
+        self.columns = size[0] - 10
+        
+        # The background covers the graph including labels sticking out of it.
+        self.background_rect = pygame.Rect(position[0] - 40, position[1] - size[1] - 10, size[0] + 80, size[1] + 70)
+        
+        self.reset()
+    
+    def reset(self):
+        self.points_per_column = 1
+        self.column_min = np.full(self.columns, np.nan)
+        self.column_max = np.full(self.columns, np.nan)
+        self.column_moving_average = np.full(self.columns, np.nan)
+        self.first_x = None
+        self.last_x = None
+        self.min_y = np.inf
+        self.max_y = -np.inf
+        
+        # Rolling window for the moving average.
+        self.moving_average_window = deque()
+        self.moving_average_sum = 0.0
+        
+        # Cached background.
+        self.background = None
+        self.background_key = None
+    
+    def update(self, x, y):
+        """
+        Adds the points of the (sorted) series x, y that are newer than the last point added. Starts over if the series went back in time.
+        """
+        if len(x) == 0:
+            return
+        if self.last_x is not None and x[-1] < self.last_x:
+            self.reset()
+        
+        start = 0 if self.last_x is None else np.searchsorted(x, self.last_x, side="right")
+        for px, py in zip(x[start:], y[start:]):
+            self.add(int(px), float(py))
+    
+    def add(self, x, y):
+        # Moving average over the previous moving_average_size points, the first point is its own average.
+        if len(self.moving_average_window) == 0:
+            moving_average = y
+        else:
+            moving_average = self.moving_average_sum / len(self.moving_average_window)
+        self.moving_average_window.append(y)
+        self.moving_average_sum += y
+        if len(self.moving_average_window) > self.moving_average_size:
+            self.moving_average_sum -= self.moving_average_window.popleft()
+        
+        # Find column, merge columns until the point fits.
+        if self.first_x is None:
+            self.first_x = x
+        column = (x - self.first_x) // self.points_per_column
+        while column >= self.columns:
+            self.merge_columns()
+            column = (x - self.first_x) // self.points_per_column
+        
+        # Add point to column.
+        self.column_min[column] = y if np.isnan(self.column_min[column]) else min(self.column_min[column], y)
+        self.column_max[column] = y if np.isnan(self.column_max[column]) else max(self.column_max[column], y)
+        self.column_moving_average[column] = moving_average
+        self.last_x = x
+        self.min_y = min(self.min_y, y)
+        self.max_y = max(self.max_y, y)
+    
+    def merge_columns(self):
+        """
+        Merges every pair of neighbouring columns, freeing the right half of the columns.
+        """
+        def merge(values, function):
+            pairs = np.full(2 * ((self.columns + 1) // 2), np.nan)
+            pairs[:self.columns] = values
+            pairs = pairs.reshape(-1, 2)
+            merged = np.full(self.columns, np.nan)
+            merged[:len(pairs)] = function(pairs)
+            return merged
+        
+        with np.errstate(invalid="ignore"):
+            self.column_min = merge(self.column_min, lambda pairs: np.fmin(pairs[:, 0], pairs[:, 1]))
+            self.column_max = merge(self.column_max, lambda pairs: np.fmax(pairs[:, 0], pairs[:, 1]))
+            self.column_moving_average = merge(self.column_moving_average, lambda pairs: np.where(np.isnan(pairs[:, 1]), pairs[:, 0], pairs[:, 1]))
+        self.points_per_column *= 2
+    
+    def get_y_bounds(self):
+        min_y, max_y = self.min_y, self.max_y
+        
+        # If there is no y range, invent one, as the y value is constant.
+        if min_y == max_y:
+            if min_y == 0:
+                min_y = -1
+                max_y = +1
+            else:
+                min_y *= 0.9
+                max_y *= 1.1
+        return min_y, max_y
+    
+    def render(self, surface):
+        # Render (and cache) axes, labels and ticks.
+        if self.first_x is None:
+            min_x, max_x, min_y, max_y = None, None, None, None
+        else:
+            min_x, max_x = self.first_x, self.first_x + self.columns * self.points_per_column
+            min_y, max_y = self.get_y_bounds()
+        background_key = (min_x, max_x, f"{min_y:.2f}" if min_y is not None else None, f"{max_y:.2f}" if max_y is not None else None)
+        if self.background is None or background_key != self.background_key:
+            self.background = self.render_background(min_x, max_x, min_y, max_y)
+            self.background_key = background_key
+        surface.blit(self.background, self.background_rect.topleft)
+        
+        # Don't render data if there is no data yet.
+        if self.first_x is None:
+            return
+        
+        # Transform columns to screen points, skipping empty columns.
+        filled = ~np.isnan(self.column_min)
+        screen_x = self.bottomleft[0] + np.arange(self.columns)[filled]
+        y_scale = (self.size[1] - 30) / (max_y - min_y)
+        screen_min = self.bottomleft[1] - y_scale * (self.column_min[filled] - min_y)
+        screen_max = self.bottomleft[1] - y_scale * (self.column_max[filled] - min_y)
+        screen_moving_average = self.bottomleft[1] - y_scale * (self.column_moving_average[filled] - min_y)
+        if len(screen_x) < 2:
+            return
+        
+        # Render raw data as the min/max envelope of every column, and the moving average through the columns.
+        raw_data_points = np.stack([np.repeat(screen_x, 2), np.column_stack([screen_min, screen_max]).ravel()], axis=1)
+        pygame.draw.lines(surface, self.raw_data_color, False, raw_data_points.tolist())
+        pygame.draw.lines(surface, self.moving_average_color, False, np.column_stack([screen_x, screen_moving_average]).tolist())
+    
+    def render_background(self, min_x, max_x, min_y, max_y):
+        """
+        Renders axes, title, axis labels and ticks to a transparent surface covering background_rect.
+        """
+        background = pygame.Surface(self.background_rect.size)
+        background.set_colorkey((0, 0, 0))
+        offset_x, offset_y = self.background_rect.topleft
+        bottomleft = (self.bottomleft[0] - offset_x, self.bottomleft[1] - offset_y)
+        size = self.size
+        axes_color = self.axes_color
+        
+        # Render axes.
+        pygame.draw.line(background, axes_color, bottomleft, (bottomleft[0], bottomleft[1] - size[1] + 30))
+        pygame.draw.line(background, axes_color, bottomleft, (bottomleft[0] + size[0] - 10, bottomleft[1]))
+        
+        # Render axis labels and graph title.
+        render_text_center(background, self.big_font, self.title, axes_color, (bottomleft[0] + (size[0] / 2), bottomleft[1] - size[1] + 10))
+        render_text_center(background, self.small_font, self.x_axis_label, axes_color, (bottomleft[0] + (size[0] / 2), bottomleft[1] + 25))
+        render_text_center(background, self.small_font, self.y_axis_label, axes_color, (bottomleft[0] - 15, bottomleft[1] - (size[1] / 2) + 10), rotation=90)
+        
+        # Don't render ticks if there is no data.
+        if min_x is None:
+            return background
+        
+        # Render y axis ticks.
+        render_text_center(background, self.small_font, f"{max_y:.2f}", axes_color, (bottomleft[0] - 12, bottomleft[1] - size[1] + 30), rotation=90)
+        pygame.draw.line(background, axes_color, (bottomleft[0], bottomleft[1] - size[1] + 30), (bottomleft[0] - 5, bottomleft[1] - size[1] + 30))
+        render_text_center(background, self.small_font, f"{min_y:.2f}", axes_color, (bottomleft[0] - 12, bottomleft[1] - 0), rotation=90)
+        pygame.draw.line(background, axes_color, (bottomleft[0], bottomleft[1]), (bottomleft[0] - 5, bottomleft[1]))
+        
+        # Render x axis ticks.
+        tick_interval = max(50, ((max_x - min_x) // 400) * 100)
+        xticks = list(range(min_x, max_x, tick_interval)) + [max_x]
+        for xtick in xticks:
+            screen_x = bottomleft[0] + ((xtick - min_x) / (max_x - min_x)) * (size[0] - 10)
+            screen_y = bottomleft[1]
+            
+            pygame.draw.line(background, axes_color, (screen_x, screen_y), (screen_x, screen_y + 5))
+            render_text_center(background, self.small_font, f"{xtick}", axes_color, (screen_x, screen_y + 13))
+        
+        return background
+    
+def window(resolution=(1920, 1080), simulation=None, threaded=False, target_sweeps_per_second=None, trajectory=None, profiler=None, trace_path=None):
+    """
+    Opens the visualizer. By default the simulation is updated once per frame. If threaded, a background worker updates the simulation as fast as possible (or at target_sweeps_per_second) and every frame renders the latest snapshot.
+    
+    If a trajectory (a TrajectoryReader) is given, its frames are replayed instead of running a simulation.
+    
+    The stages of the main loop are timed by the profiler (a disabled one by default), (P) toggles it together with an overlay of the timings. On exit the timings are logged, and written as a Chrome trace to trace_path if given.
+    
+    If the background worker fails, the window closes and the exception of the worker is raised.
+    """
+    if simulation is None and trajectory is None:
         logger.critical("Simulation cannot be None! Please supply a simulation.")
         return
+    if trajectory is not None and len(trajectory) == 0:
+        logger.critical("Trajectory has no frames to replay!")
+        return
     
     # Initialize pygame.
     pygame.init()
@@ -109,24 +383,49 @@ def window(resolution=(1920, 1080), simulation=None):
     temperature_controller = TemperatureController(initial_temperature=10)
     zoom_controller = ZoomController(initial_zoom=1)
     render_mode_controller = RenderModeController(initial_mode="arrow")
+    replay_controller = ReplayController(frames=len(trajectory)) if trajectory is not None else None
+    
+    # Profiler.
+    if profiler is None:
+        profiler = Profiler(enabled=False)
+    profiler_controller = ProfilerController(profiler)
+    profiler_summary = {}
+    
+    # Average spin graph.
+    average_spin_graph = GraphPanel(small_font, big_font, position=(20, resolution[1] / 2 + 100), size=(400, 200), axes_color=(255, 255, 255), raw_data_color=(0, 0, 255), moving_average_color=(255, 0, 0), title="Average Spin over Time", x_axis_label="Time", y_axis_label="Average Spin")
+    
+    # Start background worker.
+    worker = None
+    if threaded and trajectory is None:
+        worker = SimulationWorker(simulation, temperature=temperature_controller.get_temperature(), target_sweeps_per_second=target_sweeps_per_second, profiler=profiler)
+        worker.start()
+    
+    # Sweep rate measurement.
+    sweep_rate_time = time.perf_counter()
+    sweep_rate_sweeps = simulation.sweeps if trajectory is None else 0
+    sweeps_per_second = 0
     
     # Main loop.
     clock = pygame.time.Clock()
     running = True
     while running:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                running = False
-        
-        # Get keys pressed.
-        keys_pressed = pygame.key.get_pressed()
+        with profiler.phase("events"):
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    running = False
+            
+            # Get keys pressed.
+            keys_pressed = pygame.key.get_pressed()
         
         # Close window if escape is pressed.
         if keys_pressed[pygame.K_ESCAPE]:
             running = False
         
-        # Handle temperature control.
-        temperature_controller.handle_inputs(keys_pressed)
+        # Handle temperature control, or replay control when replaying (both use the left and right keys).
+        if replay_controller is None:
+            temperature_controller.handle_inputs(keys_pressed)
+        else:
+            replay_controller.handle_inputs(keys_pressed)
         temperature = temperature_controller.get_temperature()
         
         # Handle zoom control.
@@ -138,39 +437,132 @@ def window(resolution=(1920, 1080), simulation=None):
         render_mode_controller.handle_inputs(keys_pressed)
         render_mode = render_mode_controller.get_render_mode()
         
+        # Handle profiler control.
+        profiler_controller.handle_inputs(keys_pressed)
+        
         # Clear display.
         display.fill((0, 0, 0))
         
+        # Update simulation, or hand the temperature to the worker, or read the replayed frame, and get the state to render.
+        with profiler.phase("update"):
+            if replay_controller is not None:
+                frame_index = replay_controller.get_frame_index()
+                spins = trajectory.get_frame(frame_index)
+                sweep = trajectory.get_sweep(frame_index)
+                average_spin = int(np.sum(spins, dtype=np.int64)) / spins.size
+                snapshot = SimulationSnapshot(spins, average_spin, None, sweep, np.array([sweep]), np.array([average_spin]))
+            elif worker is None:
+                simulation.update(temperature=temperature)
+                snapshot = take_snapshot(simulation, copy=False)
+            else:
+                worker.set_temperature(temperature)
+                snapshot = worker.get_snapshot()
+        
+        # Close the window if the worker failed, rather than rendering its last snapshot forever.
+        if worker is not None and worker.error is not None:
+            logger.critical(f"Simulation stopped with an error: {worker.error!r}")
+            running = False
+        
         # Render world.
-        simulation.update(temperature=temperature)
-        simulation.render(display, font, resolution, zoom=zoom, render_mode=render_mode)
+        with profiler.phase("render"):
+            render_lattice(display, snapshot.spins, resolution, zoom=zoom, render_mode=render_mode)
         
         # Get average spin.
-        average_spin = simulation.get_average_spin()
+        average_spin = snapshot.average_spin
         
-        # Render debug text.
-        render_text_topleft(display, font, f"Temperature: {temperature}", (10, 10), (255, 0, 0))
-        render_text_topleft(display, font, f"Zoom: {zoom} (zoom target: {zoom_target})", (10, 30), (255, 0, 0))
-        render_text_topleft(display, font, f"Render mode: {render_mode}", (10, 50), (255, 0, 0))
-        render_text_topleft(display, font, f"Average spin: {average_spin:.2f}", (10, 70), (255, 0, 0))
+        # Measure sweep rate and summarize the profiler about twice per second.
+        now = time.perf_counter()
+        if now - sweep_rate_time >= 0.5:
+            sweeps_per_second = (snapshot.sweeps - sweep_rate_sweeps) / (now - sweep_rate_time)
+            sweep_rate_time = now
+            sweep_rate_sweeps = snapshot.sweeps
+            profiler_summary = profiler.get_summary() if profiler.enabled else {}
         
-        render_text_center(display, font, f"Controls: [temperature: left/right, zoom: up/down, render mode: (A)rrow/(R)ectangle]", (255, 0, 0), (resolution[0] / 2, 20))
+        # Render debug text.
+        with profiler.phase("text"):
+            if replay_controller is None:
+                render_text_topleft(display, font, f"Temperature: {temperature}", (10, 10), (255, 0, 0))
+            else:
+                render_text_topleft(display, font, f"Replay: frame {frame_index + 1}/{len(trajectory)} (sweep {snapshot.sweeps})", (10, 10), (255, 0, 0))
+            render_text_topleft(display, font, f"Zoom: {zoom} (zoom target: {zoom_target})", (10, 30), (255, 0, 0))
+            render_text_topleft(display, font, f"Render mode: {render_mode}", (10, 50), (255, 0, 0))
+            render_text_topleft(display, font, f"Average spin: {average_spin:.2f}", (10, 70), (255, 0, 0))
+            render_text_topleft(display, font, f"Sweeps/s: {sweeps_per_second:.0f}, FPS: {clock.get_fps():.0f}", (10, 90), (255, 0, 0))
+            
+            if replay_controller is None:
+                render_text_center(display, font, f"Controls: [temperature: left/right, zoom: up/down, render mode: (A)rrow/(R)ectangle, (P)rofiler]", (255, 0, 0), (resolution[0] / 2, 20))
+            else:
+                render_text_center(display, font, f"Controls: [pause: space, step: left/right, zoom: up/down, render mode: (A)rrow/(R)ectangle]", (255, 0, 0), (resolution[0] / 2, 20))
+            
+            # Render profiler overlay.
+            if profiler.enabled:
+                render_profiler_overlay(display, small_font, profiler_summary, (resolution[0] - 420, 50))
         
-        render_graph(display, small_font, big_font, x=range(len(simulation.average_spin_over_time)), y=simulation.average_spin_over_time, position=(20, resolution[1] / 2 + 100), size=(400, 200), axes_color=(255, 255, 255), raw_data_color=(0, 0, 255), moving_average_color=(255, 0, 0), title="Average Spin over Time", x_axis_label="Time", y_axis_label="Average Spin")
+        with profiler.phase("graph"):
+            average_spin_graph.update(snapshot.average_spin_times, snapshot.average_spin_values)
+            average_spin_graph.render(display)
         
         # Update display.
-        pygame.display.flip()
+        with profiler.phase("flip"):
+            pygame.display.flip()
         
         # Tick clock.
         clock.tick(30)
     
+    # Stop background worker.
+    if worker is not None:
+        worker.stop()
+    
+    # Report profiler timings.
+    if len(profiler.get_summary()) > 0:
+        profiler.log_summary()
+        if trace_path is not None:
+            profiler.export_chrome_trace(trace_path)
+    
     # Quit pygame.
     pygame.quit()
+    
+    # Hand the error of the worker to the caller.
+    if worker is not None and worker.error is not None:
+        raise worker.error
+
+class TextCache:
+    """
+    Least recently used cache of rendered text surfaces, so unchanged text is blitted instead of rendered again every frame.
+    """
+    
+    def __init__(self, capacity=256):
+        self.capacity = capacity
+        self.surfaces = OrderedDict()
+    
+    def get(self, key, render):
+        """
+        Returns the surface cached under key, rendering it with render() if it is not cached.
+        """
+        if key in self.surfaces:
+            self.surfaces.move_to_end(key)
+            return self.surfaces[key]
+        
+        # Render surface, evict the least recently used surface if the cache is full.
+        surface = render()
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.capacity:
+            self.surfaces.popitem(last=False)
+        return surface
+
+TEXT_CACHE = TextCache()
 
 def render_text_topleft(display, font, text, position, color):
-    font.render_to(display, position, text, color)
+    surface = TEXT_CACHE.get(("topleft", font, text, tuple(color)), lambda: font.render(text, color)[0])
+    display.blit(surface, position)
 
 def render_text_center(display, font, text, color, position, rotation=0):
+    surf = TEXT_CACHE.get(("center", font, text, tuple(color), rotation), lambda: render_text_surface(font, text, color, rotation))
+    
+    # Blit text to screen.
+    display.blit(surf, (position[0] - surf.get_width() / 2, position[1] - surf.get_height() / 2))
+
+def render_text_surface(font, text, color, rotation=0):
     # Get text render rect.
     text_surface, rect = font.render(text, False, color)
     
@@ -181,101 +573,24 @@ def render_text_center(display, font, text, color, position, rotation=0):
     # Rotate surface if applicable.
     if rotation != 0:
         surf = pygame.transform.rotate(surf, rotation)
-    
-    # Blit text to screen.
-    if rotation % 180 == 90:
-        display.blit(surf, (position[0] - text_surface.get_height() / 2, position[1] - text_surface.get_width() / 2))
-    else:
-        display.blit(surf, (position[0] - text_surface.get_width() / 2, position[1] - text_surface.get_height() / 2))
+    return surf
+
+def render_profiler_overlay(display, font, summary, position):
+    """
+    Renders a table of the phase timings in the profiler summary, with its top left corner at position.
+    """
+    # Render every column at a fixed offset, the font need not be monospaced.
+    column_offsets = [0, 140, 220, 300]
+    rows = [["Phase", "p50 (ms)", "p95 (ms)", "p99 (ms)"]]
+    rows += [[name, f"{statistics['p50']:.2f}", f"{statistics['p95']:.2f}", f"{statistics['p99']:.2f}"] for name, statistics in summary.items()]
+    for row, texts in enumerate(rows):
+        for column_offset, text in zip(column_offsets, texts):
+            render_text_topleft(display, font, text, (position[0] + column_offset, position[1] + row * 18), (255, 255, 0))
 
 def render_graph(surface, small_font, big_font, x, y, position, size, **kwargs):
-    # Render axes.
-    axes_color = kwargs["axes_color"] if "axes_color" in kwargs else (255, 255, 255)
-    bottomleft = (position[0] + 10, position[1] + 10)
-    pygame.draw.line(surface, axes_color, bottomleft, (bottomleft[0], bottomleft[1] - size[1] + 30))
-    pygame.draw.line(surface, axes_color, bottomleft, (bottomleft[0] + size[0] - 10, bottomleft[1]))
-    
-    # Render axis labels and graph title.
-    graph_title = kwargs["title"] if "title" in kwargs else "Graph Title"
-    render_text_center(surface, big_font, graph_title, axes_color, (bottomleft[0] + (size[0] / 2), bottomleft[1] - size[1] + 10))
-    x_axis_label = kwargs["x_axis_label"] if "x_axis_label" in kwargs else "X Axis"
-    render_text_center(surface, small_font, x_axis_label, axes_color, (bottomleft[0] + (size[0] / 2), bottomleft[1] + 25))
-    y_axis_label = kwargs["y_axis_label"] if "y_axis_label" in kwargs else "Y Axis"
-    render_text_center(surface, small_font, y_axis_label, axes_color, (bottomleft[0] - 15, bottomleft[1] - (size[1] / 2) + 10), rotation=90)
-    
-    # Get data bounds.
-    min_x = min(x)
-    max_x = max(x)
-    min_y = min(y)
-    max_y = max(y)
-    
-    # Don't render data if there is no x range.
-    if min_x == max_x:
-        return
-    
-    # If there is no y range, invent one, as the y value is constant.
-    if min_y == max_y:
-        if min_y == 0:
-            min_y = -1
-            max_y = +1
-        else:
-            min_y *= 0.9
-            max_y *= 1.1
-    
-    # Render y axis ticks.
-    render_text_center(surface, small_font, f"{max_y:.2f}", axes_color, (bottomleft[0] - 12, bottomleft[1] - size[1] + 30), rotation=90)
-    pygame.draw.line(surface, axes_color, (bottomleft[0], bottomleft[1] - size[1] + 30), (bottomleft[0] - 5, bottomleft[1] - size[1] + 30))
-    render_text_center(surface, small_font, f"{min_y:.2f}", axes_color, (bottomleft[0] - 12, bottomleft[1] - 0), rotation=90)
-    pygame.draw.line(surface, axes_color, (bottomleft[0], bottomleft[1]), (bottomleft[0] - 5, bottomleft[1]))
-    
-    # Render x axis ticks.
-    tick_interval = max(50, ((max_x - min_x) // 400) * 100)
-    xticks = list(range(0, max_x, tick_interval)) + [max_x]
-    for xtick in xticks:
-        screen_x = bottomleft[0] + (xtick / max_x) * (size[0] - 10)
-        screen_y = bottomleft[1]
-        
-        pygame.draw.line(surface, axes_color, (screen_x, screen_y), (screen_x, screen_y + 5))
-        render_text_center(surface, small_font, f"{xtick}", axes_color, (screen_x, screen_y + 13))
-    
-    # Transform all raw data points to screen points.
-    raw_data_screen_points = []
-    for px, py in zip(x, y):
-        screen_x = bottomleft[0] + (size[0] - 10) * (px - min_x) / (max_x - min_x)
-        screen_y = bottomleft[1] - (size[1] - 30) * (py - min_y) / (max_y - min_y)
-        raw_data_screen_points.append((screen_x, screen_y))
-    
-    # Render raw data lines.
-    raw_data_color = kwargs["raw_data_color"] if "raw_data_color" in kwargs else (255, 255, 255)
-    for index in range(len(raw_data_screen_points)):
-        if index == 0:
-            continue
-        
-        pygame.draw.line(surface, raw_data_color, raw_data_screen_points[index - 1], raw_data_screen_points[index])
-    
-    # Calculate moving average data points.
-    filter_size = min(len(x), 50)
-    moving_average_y = []
-    for index in range(len(y)):
-        if index == 0:
-            moving_average_y.append(y[index])
-            continue
-        
-        start = max(0, index - filter_size)
-        end = index
-        moving_average_y.append(sum(y[start:end]) / (end - start))
-    
-    # Transform moving average data points to screen points.
-    moving_average_screen_points = []
-    for px, py in zip(x, moving_average_y):
-        screen_x = bottomleft[0] + (size[0] - 10) * (px - min_x) / (max_x - min_x)
-        screen_y = bottomleft[1] - (size[1] - 30) * (py - min_y) / (max_y - min_y)
-        moving_average_screen_points.append((screen_x, screen_y))
-    
-    # Render moving average lines.
-    moving_average_color = kwargs["moving_average_color"] if "moving_average_color" in kwargs else (255, 255, 255)
-    for index in range(len(moving_average_screen_points)):
-        if index == 0:
-            continue
-        
-        pygame.draw.line(surface, moving_average_color, moving_average_screen_points[index - 1], moving_average_screen_points[index])
+    """
+    Renders a graph of the series x, y in one go. To redraw a growing series every frame, keep a GraphPanel and update it instead.
+    """
+    graph = GraphPanel(small_font, big_font, position, size, **kwargs)
+    graph.update(x, y)
+    graph.render(surface)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The modules are imported as src.<module> from the repository root, as in __main__.py.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from src.checkpoint import load_checkpoint, save_checkpoint
+from src.interactions import next_nearest_neighbour_interaction, power_law_interaction
+from src.simulation import Simulation, UPDATE_SCHEMES
+
+def simulation_state(simulation):
+    """
+    Returns everything a resumed run has to reproduce: lattice, running totals, observables and history.
+    """
+    return {
+        "spins": np.array(simulation.spins),
+        "sweeps": simulation.sweeps,
+        "total_magnetization": simulation.total_magnetization,
+        "total_energy": simulation.total_energy,
+        "susceptibility": simulation.get_susceptibility(),
+        "specific_heat": simulation.get_specific_heat(),
+        "binder_cumulant": simulation.get_binder_cumulant(),
+        "history": np.array(simulation.average_spin_over_time.values()),
+    }
+
+def assert_resumes_identically(tmp_path, packed, make_simulation, interaction=None):
+    # Run, checkpoint halfway and keep running, then resume from the checkpoint and run the same updates again.
+    np.random.seed(7)
+    simulation = make_simulation()
+    for _ in range(30):
+        simulation.update(2.0)
+    path = tmp_path / "simulation.ckpt"
+    save_checkpoint(simulation, path, packed=packed)
+    for temperature in [2.0] * 20 + [1.2] * 20:
+        simulation.update(temperature)
+    expected = simulation_state(simulation)
+    
+    # Disturb the random number generator, the checkpoint has to restore it.
+    np.random.seed(8)
+    resumed = load_checkpoint(path, interaction=interaction)
+    for temperature in [2.0] * 20 + [1.2] * 20:
+        resumed.update(temperature)
+    actual = simulation_state(resumed)
+    
+    for name, value in expected.items():
+        np.testing.assert_array_equal(actual[name], value, err_msg=name)
+
+@pytest.mark.parametrize("update_scheme", UPDATE_SCHEMES)
+@pytest.mark.parametrize("packed", [True, False])
+def test_resumed_run_is_identical(tmp_path, update_scheme, packed):
+    assert_resumes_identically(tmp_path, packed, lambda: Simulation(12, 9, update_scheme=update_scheme, external_field=0.2, history_capacity=64))
+
+@pytest.mark.parametrize("update_scheme", ["checkerboard_heat_bath", "checkerboard_metropolis"])
+@pytest.mark.parametrize("packed", [True, False])
+def test_resumed_interaction_run_is_identical(tmp_path, update_scheme, packed):
+    # Next-nearest neighbours update by colour, the long-range interaction one spin at a time.
+    for interaction in [next_nearest_neighbour_interaction(1.0, -0.4), power_law_interaction(8, 6, 1.0, 2.0)]:
+        assert_resumes_identically(tmp_path, packed, lambda: Simulation(8, 6, mode="interaction", update_scheme=update_scheme, external_field=0.2, interaction=interaction), interaction=interaction)
+
+def test_checkpoint_keeps_the_constants(tmp_path):
+    simulation = Simulation(5, 4, update_scheme="wolff", coupling_constant=0.7, boltzmann_constant=1.3, external_field=-0.25)
+    simulation.update(1.5)
+    save_checkpoint(simulation, tmp_path / "simulation.ckpt")
+    resumed = load_checkpoint(tmp_path / "simulation.ckpt")
+    assert (resumed.width, resumed.height, resumed.update_scheme) == (5, 4, "wolff")
+    assert (resumed.coupling_constant, resumed.boltzmann_constant, resumed.external_field) == (0.7, 1.3, -0.25)
+    assert resumed.temperature == 1.5
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from src.cluster import label_clusters
+
+def flood_fill_labels(horizontal_bonds, vertical_bonds):
+    """
+    Labels the clusters of the active bonds with a breadth-first flood fill from every unlabelled spin in flat index order, so every cluster gets the smallest flat index in it.
+    """
+    height, width = vertical_bonds.shape[0] + 1, horizontal_bonds.shape[1] + 1
+    labels = np.full((height, width), -1)
+    for start in range(height * width):
+        if labels.flat[start] != -1:
+            continue
+        labels.flat[start] = start
+        queue = [divmod(start, width)]
+        while queue:
+            y, x = queue.pop()
+            neighbours = []
+            if x > 0 and horizontal_bonds[y, x - 1]:
+                neighbours.append((y, x - 1))
+            if x < width - 1 and horizontal_bonds[y, x]:
+                neighbours.append((y, x + 1))
+            if y > 0 and vertical_bonds[y - 1, x]:
+                neighbours.append((y - 1, x))
+            if y < height - 1 and vertical_bonds[y, x]:
+                neighbours.append((y + 1, x))
+            for neighbour in neighbours:
+                if labels[neighbour] == -1:
+                    labels[neighbour] = start
+                    queue.append(neighbour)
+    return labels
+
+@pytest.mark.parametrize("height, width", [(1, 1), (1, 7), (6, 1), (5, 5), (13, 8), (32, 32)])
+@pytest.mark.parametrize("bond_density", [0.0, 0.3, 0.5, 0.7, 1.0])
+def test_label_clusters_matches_flood_fill(height, width, bond_density):
+    rng = np.random.default_rng([height, width, int(bond_density * 10)])
+    horizontal_bonds = rng.random((height, width - 1)) < bond_density
+    vertical_bonds = rng.random((height - 1, width)) < bond_density
+    np.testing.assert_array_equal(label_clusters(horizontal_bonds, vertical_bonds), flood_fill_labels(horizontal_bonds, vertical_bonds))
+
+def test_label_clusters_spiral():
+    # A single cluster winding through the whole lattice, the worst case for merging roots.
+    size = 9
+    horizontal_bonds = np.zeros((size, size - 1), dtype=bool)
+    vertical_bonds = np.zeros((size - 1, size), dtype=bool)
+    horizontal_bonds[::2, :] = True
+    for row in range(size - 1):
+        vertical_bonds[row, -1 if (row // 2) % 2 == 0 else 0] = True
+    labels = label_clusters(horizontal_bonds, vertical_bonds)
+    np.testing.assert_array_equal(labels, flood_fill_labels(horizontal_bonds, vertical_bonds))
+    assert np.all(labels[::2, :] == 0)
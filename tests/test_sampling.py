@@ -0,0 +1,92 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from src.interactions import next_nearest_neighbour_interaction, power_law_interaction
+from src.replica_simulation import ReplicaSimulation
+from src.simulation import Simulation
+
+# A 3x3 lattice has 512 configurations, few enough to compute the exact averages.
+WIDTH, HEIGHT = 3, 3
+TEMPERATURE = 1.5
+EXTERNAL_FIELD = 0.3
+UPDATES = 20000
+BATCHES = 20
+
+def coupling_matrix(coupling):
+    """
+    Returns the (spins, spins) coupling matrix of the 3x3 lattice with open boundaries, coupling(dy, dx) gives the coupling of two spins at that offset.
+    """
+    ys, xs = np.divmod(np.arange(WIDTH * HEIGHT), WIDTH)
+    dy, dx = ys[:, None] - ys[None, :], xs[:, None] - xs[None, :]
+    return np.where((dy == 0) & (dx == 0), 0.0, coupling(dy, dx))
+
+def nearest_neighbour_couplings(dy, dx, coupling_constant=1.0, next_nearest_coupling_constant=0.0):
+    nearest = np.abs(dy) + np.abs(dx) == 1
+    diagonal = (np.abs(dy) == 1) & (np.abs(dx) == 1)
+    return coupling_constant * nearest + next_nearest_coupling_constant * diagonal
+
+def exact_averages(couplings, temperature=TEMPERATURE, external_field=EXTERNAL_FIELD):
+    """
+    Returns the exact average spin and energy, summing the Boltzmann weights of every configuration with E = -1/4 * s^T J s - H * sum(s).
+    """
+    configurations = np.array(list(itertools.product([-1, +1], repeat=WIDTH * HEIGHT)), dtype=np.float64)
+    energies = -0.25 * np.einsum("ci,ij,cj->c", configurations, couplings, configurations) - external_field * configurations.sum(axis=1)
+    weights = np.exp(-(energies - energies.min()) / temperature)
+    weights /= weights.sum()
+    return float(weights @ configurations.mean(axis=1)), float(weights @ energies)
+
+def assert_samples(samples, exact):
+    # Compare with the exact average within five standard errors, estimated from batch means so autocorrelations are accounted for.
+    batch_means = np.asarray(samples).reshape(BATCHES, -1).mean(axis=1)
+    error = batch_means.std(ddof=1) / np.sqrt(BATCHES)
+    assert abs(batch_means.mean() - exact) < 5 * error + 1e-3, f"{batch_means.mean()} +- {error}, exact {exact}"
+
+def sample(simulation, temperature=TEMPERATURE):
+    # Equilibrate, then record the average spin and energy after every update.
+    for _ in range(1000):
+        simulation.update(temperature)
+    average_spins, energies = [], []
+    for _ in range(UPDATES):
+        simulation.update(temperature)
+        average_spins.append(simulation.get_average_spin())
+        energies.append(simulation.get_energy())
+    return average_spins, energies
+
+@pytest.mark.parametrize("update_scheme", ["checkerboard_heat_bath", "checkerboard_metropolis", "wolff", "swendsen_wang"])
+def test_nearest_neighbour_sampling_is_exact(update_scheme):
+    np.random.seed(1)
+    simulation = Simulation(WIDTH, HEIGHT, update_scheme=update_scheme, external_field=EXTERNAL_FIELD, check_totals=True)
+    average_spins, energies = sample(simulation)
+    average_spin, energy = exact_averages(coupling_matrix(nearest_neighbour_couplings))
+    assert_samples(average_spins, average_spin)
+    assert_samples(energies, energy)
+
+@pytest.mark.parametrize("update_scheme", ["checkerboard_heat_bath", "checkerboard_metropolis"])
+def test_interaction_sampling_is_exact(update_scheme):
+    # Next-nearest neighbours are updated by colour, the power law one spin at a time.
+    cases = [
+        (next_nearest_neighbour_interaction(1.0, -0.6), lambda dy, dx: nearest_neighbour_couplings(dy, dx, 1.0, -0.6)),
+        (power_law_interaction(WIDTH, HEIGHT, 1.0, 2.0), lambda dy, dx: 1.0 / np.maximum(dy ** 2 + dx ** 2, 1)),
+    ]
+    for interaction, coupling in cases:
+        np.random.seed(2)
+        simulation = Simulation(WIDTH, HEIGHT, mode="interaction", update_scheme=update_scheme, external_field=EXTERNAL_FIELD, interaction=interaction)
+        average_spins, energies = sample(simulation)
+        average_spin, energy = exact_averages(coupling_matrix(coupling))
+        assert_samples(average_spins, average_spin)
+        assert_samples(energies, energy)
+
+def test_parallel_tempering_sampling_is_exact():
+    np.random.seed(3)
+    temperatures = [1.0, 1.5, 2.5]
+    simulation = ReplicaSimulation(temperatures, WIDTH, HEIGHT, update_scheme="checkerboard_metropolis", exchange_interval=1, external_field=EXTERNAL_FIELD)
+    for _ in range(1000 + UPDATES):
+        simulation.update()
+    
+    # Every temperature keeps sampling its own distribution while the lattices are swapped between them.
+    for temperature, average_spins, energies in zip(temperatures, simulation.average_spin_over_time[:, 1000:], simulation.energy_over_time[:, 1000:]):
+        average_spin, energy = exact_averages(coupling_matrix(nearest_neighbour_couplings), temperature)
+        assert_samples(average_spins, average_spin)
+        assert_samples(energies, energy)